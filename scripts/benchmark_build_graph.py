@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+import trailmap.acquisition_paths as ap
+
+
+def make_parser():
+    """Makes the build_graph benchmark command line parser"""
+    p = argparse.ArgumentParser(description="Times build_graph on synthetic "
+                                "fuel cycles of increasing size",
+                                epilog="python benchmark_build_graph.py")
+    p.add_argument('--sizes', nargs='+', type=int,
+                   default=[1000, 2000, 4000, 8000, 16000],
+                   help='numbers of facilities to benchmark')
+    p.add_argument('--commods-per-facility', dest='commods', type=int,
+                   default=3, help='commodities each facility sends')
+    p.add_argument('--fan-in', dest='fanin', type=int, default=2,
+                   help='commodities each facility receives')
+    p.add_argument('--repeat', type=int, default=3,
+                   help='keep the best of this many runs for each size')
+    p.add_argument('--seed', type=int, default=0)
+
+    return p
+
+
+def make_fuel_cycle(n_facilities, commods_per_facility, fanin, rng):
+    """Makes a sparse synthetic fuel cycle. Each facility sends a few of its
+    own commodities and receives a few commodities sent by other facilities,
+    so the number of edges grows linearly with the number of facilities.
+    """
+    facility_dict_in = {}
+    facility_dict_out = {}
+    commods = []
+    for i in range(n_facilities):
+        name = 'facility_%d' % i
+        facility_dict_out[name] = ['commod_%d_%d' % (i, j)
+                                   for j in range(commods_per_facility)]
+        commods.extend(facility_dict_out[name])
+    for name in facility_dict_out:
+        facility_dict_in[name] = rng.sample(commods, fanin)
+
+    return facility_dict_in, facility_dict_out
+
+
+def time_build_graph(facility_dict_in, facility_dict_out, repeat):
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        G = ap.build_graph(facility_dict_in, facility_dict_out)
+        best = min(best, time.perf_counter() - start)
+
+    return G, best
+
+
+def main(args=None):
+    """Prints the build_graph time per facility and edge for each size. A
+    constant time per element shows linear scaling.
+    """
+    p = make_parser()
+    ns = p.parse_args(args=args)
+    rng = random.Random(ns.seed)
+
+    print('%10s %10s %12s %16s' % ('facilities', 'edges', 'seconds',
+                                   'us/(F+E)'))
+    for size in ns.sizes:
+        (facility_dict_in,
+         facility_dict_out) = make_fuel_cycle(size, ns.commods, ns.fanin, rng)
+        (G, seconds) = time_build_graph(facility_dict_in, facility_dict_out,
+                                        ns.repeat)
+        elements = G.number_of_nodes() + G.number_of_edges()
+        print('%10d %10d %12.4f %16.3f' % (size, G.number_of_edges(), seconds,
+                                          1e6 * seconds / elements))
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -10,16 +10,35 @@ def make_parser():
     """Makes the Cyclus-Trailmap command line parser"""
     p = argparse.ArgumentParser(description="Cyclus-Trailmap command line",
                                 epilog="python main.py cyclus_input_file.xml")
-    p.add_argument('infile', nargs=1, help='Cyclus input file. Must be XML')
+    p.add_argument('infile', nargs=1, help='Cyclus input file in XML, JSON or '
+                   'Python format')
     p.add_argument('--draw', '-d', action='store_true')
     p.add_argument('--pickle', '-pi', action='store_true',
                    help="pickle graph output of fuel cycle")
     p.add_argument('--pickle-file', dest='picklefile',
                    default='trailmap.gpickle',
                    help='output path for pickled graph')
+    p.add_argument('--bipartite', '-b', action='store_true',
+                   help='model commodities as nodes between the facilities '
+                        'that trade them')
+    p.add_argument('--cutoff', type=int, default=None,
+                   help='only find pathways with at most this many steps')
+    p.add_argument('--max-paths', dest='maxpaths', type=int, default=None,
+                   help='stop after finding this many pathways')
+    p.add_argument('--time-budget', dest='timebudget', type=float,
+                   default=None,
+                   help='stop the pathway search after this many seconds')
     p.add_argument('--supress-print', '-sp', action='store_true')
     p.add_argument('--metadata', '-m', nargs=1, help='Cyclus metadata file',
                    type=argparse.FileType('r'))
+    p.add_argument('--no-cache', dest='cache', action='store_false',
+                   help='always rediscover Cyclus metadata instead of '
+                        'reusing the on-disk cache')
+    p.add_argument('--cache-dir', dest='cachedir', default=None,
+                   help='directory of the Cyclus metadata cache')
+    p.add_argument('--stream', action='store_true',
+                   help='parse the input file incrementally to bound memory '
+                        'use on large inputs')
 
     return p
 
@@ -33,12 +52,18 @@ def main(args=None):
         m = ns.metadata[0]
         commodity_dictionary = cd.build_commod_dictionary(ns.metadata[0])
     else:
-        commodity_dictionary = cd.build_commod_dictionary()
+        commodity_dictionary = cd.build_commod_dictionary(
+            use_cache=ns.cache, cache_dir=ns.cachedir)
     (facility_dict_in,
-    facility_dict_out) = pi.parse_input(ns.infile[0], commodity_dictionary)
-    (G, pathways) = ap.conduct_apa(facility_dict_in, facility_dict_out)
+    facility_dict_out) = pi.parse_input(ns.infile[0], commodity_dictionary,
+                                     stream=ns.stream)
+    (G, pathways) = ap.conduct_apa(facility_dict_in, facility_dict_out,
+                                   bipartite=ns.bipartite, cutoff=ns.cutoff,
+                                   max_paths=ns.maxpaths,
+                                   time_budget=ns.timebudget)
 
     if ns.supress_print is False:
+        ap.print_search_stats(pathways.stats)
         pa.print_graph_parameters(G, pathways)
         ap.print_acquisition_paths(pathways)
 
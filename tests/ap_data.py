@@ -1,3 +1,13 @@
+import networkx as nx
+
+
+def random_graph(seed, n=10, p=0.25, create_using=nx.MultiDiGraph):
+    '''Seeded random graph of n facilities 0..n-1, with each directed
+    edge present with probability p
+    '''
+    return create_using(nx.gnp_random_graph(n, p, seed=seed, directed=True))
+
+
 # testdata format
 # name, edges, facility_dict_in, facility_dict_out, exp_paths
 testdata = [
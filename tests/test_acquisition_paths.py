@@ -2,7 +2,7 @@ import trailmap.acquisition_paths as ap
 import trailmap.parse_input as pi
 import networkx as nx
 import pytest
-from tests.ap_data import testdata
+from tests.ap_data import testdata, random_graph
 # testdata format
 # name, edges, facility_dict_in, facility_dict_out, exp_paths
 
@@ -92,3 +92,295 @@ def test_apa(name, edges, fd_in, fd_out, exp_paths):
     (G, obs_paths) = ap.conduct_apa(fd_in, fd_out)
 
     assert obs_paths == exp_paths
+
+
+def edge_set(G):
+    return sorted((u, v, d['commodity']) for u, v, d in G.edges(data=True))
+
+
+def build_graph_pairwise(fd_in, fd_out):
+    '''Reference implementation that tests every sender/receiver pair'''
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(fd_in.keys())
+    for receiver, incommods in fd_in.items():
+        for sender, outcommods in fd_out.items():
+            for commod in set(incommods).intersection(outcommods):
+                G.add_edge(sender, receiver, commodity=commod)
+    return G
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_build_graph_matches_pairwise(name, edges, fd_in, fd_out, exp_paths):
+    exp_G = build_graph_pairwise(fd_in, fd_out)
+    obs_G = ap.build_graph(fd_in, fd_out)
+
+    assert list(obs_G.nodes()) == list(exp_G.nodes())
+    assert edge_set(obs_G) == edge_set(exp_G)
+
+
+def test_build_graph_repeated_commods():
+    fd_in = {'Sender': [], 'Receiver': ['leu', 'leu', 'heu']}
+    fd_out = {'Sender': ['leu', 'heu', 'leu'], 'Receiver': []}
+
+    obs_G = ap.build_graph(fd_in, fd_out)
+
+    assert edge_set(obs_G) == [('Sender', 'Receiver', 'heu'),
+                               ('Sender', 'Receiver', 'leu')]
+
+
+def test_build_sender_index():
+    fd_out = {'Mine': ['nat_u'], 'Enrich': ['leu', 'tails'],
+              'Reprocess': ['nat_u', 'nat_u']}
+    exp = {'nat_u': ['Mine', 'Reprocess'], 'leu': ['Enrich'],
+           'tails': ['Enrich']}
+
+    assert ap.build_sender_index(fd_out) == exp
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_build_bipartite_graph(name, edges, fd_in, fd_out, exp_paths):
+    G = ap.build_bipartite_graph(fd_in, fd_out)
+    obs_G = ap.project_facility_graph(G)
+
+    assert ap.is_bipartite_graph(G)
+    assert sorted(ap.get_facility_nodes(G)) == sorted(obs_G.nodes())
+    assert edge_set(obs_G) == edge_set(ap.build_graph(fd_in, fd_out))
+
+
+def test_build_bipartite_graph_edge_count():
+    fd_in = {'Mine1': [], 'Mine2': [], 'Mine3': [],
+             'Enrich1': ['nat_u'], 'Enrich2': ['nat_u']}
+    fd_out = {'Mine1': ['nat_u'], 'Mine2': ['nat_u'], 'Mine3': ['nat_u'],
+              'Enrich1': ['leu'], 'Enrich2': ['leu']}
+
+    G = ap.build_bipartite_graph(fd_in, fd_out)
+
+    # 3 senders + 2 receivers of nat_u; leu has no receiver
+    assert G.number_of_edges() == 5
+    assert ap.commodity_node('leu') not in G
+    assert G.nodes[ap.commodity_node('nat_u')]['commodity'] == 'nat_u'
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_apa_bipartite(name, edges, fd_in, fd_out, exp_paths):
+    (G, obs_paths) = ap.conduct_apa(fd_in, fd_out, bipartite=True)
+
+    assert obs_paths == exp_paths
+
+
+def test_find_simple_paths_bipartite_shared_commodity():
+    # Storage receives and sends leu, so a facility pathway passes through
+    # the leu commodity node twice
+    fd_in = {'Enrich': [], 'Storage': ['leu'], 'Reactor': ['leu']}
+    fd_out = {'Enrich': ['leu'], 'Storage': ['leu'], 'Reactor': []}
+    G = ap.build_bipartite_graph(fd_in, fd_out)
+
+    obs = ap.find_simple_paths(G, 'Enrich', 'Reactor')
+
+    assert obs == {('Enrich', 'Reactor'), ('Enrich', 'Storage', 'Reactor')}
+
+
+def test_iter_facility_paths_missing_node():
+    G = ap.build_bipartite_graph({'A': []}, {'A': []})
+
+    with pytest.raises(nx.NodeNotFound):
+        list(ap.iter_facility_paths(G, 'A', {'B'}))
+
+
+def find_simple_paths_pairwise(G, sources, sinks):
+    '''Reference implementation with one search per source/sink pair'''
+    pathways = set()
+    for source in sources:
+        for sink in sinks:
+            pathways.update(tuple(path) for path in
+                            nx.all_simple_paths(G, source, sink))
+    return pathways
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_find_simple_paths_matches_pairwise(seed):
+    G = random_graph(seed, 9, 0.3)
+    sources = [0, 1, 2]
+    sinks = [2, 5, 7, 8]
+
+    obs = ap.find_simple_paths(G, sources, sinks)
+
+    assert obs == find_simple_paths_pairwise(G, sources, sinks)
+
+
+def test_find_simple_paths_through_sink():
+    G = nx.MultiDiGraph()
+    G.add_edges_from([("A", "B"), ("B", "C"), ("A", "B")])
+
+    obs = ap.find_simple_paths(G, ["A"], ["B", "C"])
+
+    assert obs == {("A", "B"), ("A", "B", "C")}
+
+
+def test_iter_facility_paths_yields_once():
+    G = nx.MultiDiGraph(nx.complete_graph(6, create_using=nx.DiGraph))
+
+    obs = list(ap.iter_facility_paths(G, 0, {4, 5}))
+
+    assert len(obs) == len(set(obs))
+    assert set(obs) == find_simple_paths_pairwise(G, [0], [4, 5])
+
+
+def test_iter_facility_paths_prunes_dead_ends():
+    # a large storage subgraph hangs off the source but reaches no sink
+    G = nx.MultiDiGraph(nx.complete_graph(8, create_using=nx.DiGraph))
+    G.add_edges_from([("Source", 0), ("Source", "Sink")])
+    expanded = []
+    successors = G.successors
+    G.successors = lambda node: expanded.append(node) or successors(node)
+
+    obs = list(ap.iter_facility_paths(G, "Source", {"Sink"}))
+
+    assert obs == [("Source", "Sink")]
+    assert expanded == ["Source"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reachability_index(seed):
+    G = random_graph(seed, 12, 0.12)
+    index = ap.ReachabilityIndex(G)
+
+    for a in G:
+        for b in G:
+            assert index.can_reach(a, b) == nx.has_path(G, a, b)
+
+
+def test_reachability_index_targets():
+    G = nx.MultiDiGraph([("A", "B"), ("B", "C"), ("C", "B")])
+    index = ap.ReachabilityIndex(G, ["C"])
+
+    assert index.can_reach("A", "C")
+    assert index.can_reach("B", "C")
+    with pytest.raises(ValueError):
+        index.can_reach("C", "A")
+    with pytest.raises(nx.NodeNotFound):
+        ap.ReachabilityIndex(G, ["D"])
+
+
+def test_find_simple_paths_missing_sink():
+    G = nx.MultiDiGraph([("A", "B")])
+
+    with pytest.raises(nx.NodeNotFound):
+        ap.find_simple_paths(G, "A", "C")
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_apa_stream(name, edges, fd_in, fd_out, exp_paths):
+    (G, obs_paths) = ap.conduct_apa(fd_in, fd_out, stream=True)
+    obs_paths = list(obs_paths)
+
+    assert len(obs_paths) == len(exp_paths)
+    assert set(obs_paths) == exp_paths
+
+
+def dense_graph():
+    G = nx.MultiDiGraph(nx.complete_graph(7, create_using=nx.DiGraph))
+    G.add_edges_from([("Source", 0), (6, "Sink")])
+    return G
+
+
+def test_find_simple_paths_complete():
+    obs = ap.find_simple_paths(dense_graph(), "Source", "Sink")
+
+    assert not obs.truncated
+    assert obs.stats['pathways'] == len(obs)
+    assert obs.stats['sources_completed'] == 1
+
+
+@pytest.mark.parametrize("cutoff", [0, 1, 2, 3, 4, 5])
+def test_find_simple_paths_cutoff(cutoff):
+    G = dense_graph()
+    exp = {tuple(path) for path in nx.all_simple_paths(G, "Source", "Sink",
+                                                        cutoff=cutoff)}
+
+    obs = ap.find_simple_paths(G, "Source", "Sink", cutoff=cutoff)
+
+    assert obs == exp
+    assert obs.truncated
+    assert obs.stats['cutoff_reached']
+
+
+def test_find_simple_paths_cutoff_not_reached():
+    G = nx.MultiDiGraph([("A", "B"), ("B", "C")])
+
+    obs = ap.find_simple_paths(G, "A", "C", cutoff=2)
+
+    assert obs == {("A", "B", "C")}
+    assert not obs.truncated
+
+
+@pytest.mark.parametrize("max_paths", [0, 1, 10])
+def test_find_simple_paths_max_paths(max_paths):
+    G = dense_graph()
+    every = ap.find_simple_paths(G, "Source", "Sink")
+
+    obs = ap.find_simple_paths(G, "Source", "Sink", max_paths=max_paths)
+
+    assert len(obs) == max_paths
+    assert obs.issubset(every)
+    assert obs.truncated
+    assert obs.stats['max_paths_reached']
+    assert obs.stats['sources_completed'] == 0
+
+
+def test_find_simple_paths_max_paths_exact():
+    G = nx.MultiDiGraph([("A", "B"), ("B", "C"), ("A", "C")])
+
+    obs = ap.find_simple_paths(G, "A", "C", max_paths=2)
+
+    assert len(obs) == 2
+    assert not obs.truncated
+
+
+def test_find_simple_paths_time_budget():
+    G = nx.MultiDiGraph(nx.complete_graph(12, create_using=nx.DiGraph))
+
+    obs = ap.find_simple_paths(G, 0, 11, time_budget=0.05)
+
+    assert obs.truncated
+    assert obs.stats['time_budget_reached']
+    assert obs.stats['elapsed'] < 5
+
+
+def test_find_simple_paths_time_budget_many_sources():
+    # each source needs far fewer search steps than DEADLINE_CHECK_INTERVAL
+    G = nx.MultiDiGraph()
+    for i in range(3000):
+        G.add_edges_from([(("Source", i), ("Facility", i)),
+                          (("Facility", i), "Sink")])
+    sources = [("Source", i) for i in range(3000)]
+
+    obs = ap.find_simple_paths(G, sources, ["Sink"], time_budget=0.001)
+
+    assert obs.truncated
+    assert obs.stats['time_budget_reached']
+    assert obs.stats['sources_completed'] < 3000
+
+
+def test_find_simple_paths_time_budget_expired():
+    G = nx.MultiDiGraph([("A", "B")])
+
+    obs = ap.find_simple_paths(G, "A", "B", time_budget=0)
+
+    assert obs == set()
+    assert obs.truncated
+    assert obs.stats['sources_completed'] == 0
+
+
+def test_apa_stats():
+    fd_in = {"Source": [], "Facility": ["commodity"],
+             "Sink": ["changedcommodity"]}
+    fd_out = {"Source": ["commodity"], "Facility": ["changedcommodity"],
+              "Sink": []}
+    stats = {}
+
+    (G, obs_paths) = ap.conduct_apa(fd_in, fd_out, stream=True, max_paths=0,
+                                    stats=stats)
+
+    assert list(obs_paths) == []
+    assert stats['truncated']
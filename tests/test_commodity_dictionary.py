@@ -1,6 +1,8 @@
 import trailmap.commodity_dictionary as cd
 import pytest
 import json
+import sys
+import types
 
 
 with open('tests/metadata.json') as f:
@@ -60,3 +62,205 @@ def test_build_facility_dictionary_subset():
 
     assert cd.build_facility_dictionary(metadata, archetypes) == exp
     
+
+
+def make_library(directory, name, contents):
+    path = directory / name
+    path.write_bytes(contents)
+    return path
+
+
+def test_find_library_files(tmp_path):
+    (tmp_path / 'lib').mkdir()
+    make_library(tmp_path / 'lib', 'libagents.so', b'agents')
+    make_library(tmp_path / 'lib', 'README', b'not a library')
+    make_library(tmp_path, 'libcycamore.dylib', b'cycamore')
+
+    obs = cd.find_library_files([str(tmp_path)])
+    exp = sorted([str((tmp_path / 'lib' / 'libagents.so').resolve()),
+                  str((tmp_path / 'libcycamore.dylib').resolve())])
+
+    assert obs == exp
+
+
+def test_cache_key_changes_with_library(tmp_path):
+    lib = make_library(tmp_path, 'libagents.so', b'agents')
+    key = cd.cache_key(cd.cyclus_fingerprint('/usr', [str(tmp_path)]))
+
+    assert key == cd.cache_key(cd.cyclus_fingerprint('/usr', [str(tmp_path)]))
+
+    lib.write_bytes(b'rebuilt agents')
+    assert key != cd.cache_key(cd.cyclus_fingerprint('/usr', [str(tmp_path)]))
+
+
+def test_cache_key_changes_with_install(tmp_path):
+    make_library(tmp_path, 'libagents.so', b'agents')
+    key = cd.cache_key(cd.cyclus_fingerprint('/usr', [str(tmp_path)]))
+
+    assert key != cd.cache_key(cd.cyclus_fingerprint('/opt', [str(tmp_path)]))
+
+
+def test_cached_metadata_round_trip(tmp_path):
+    archetypes = [':cycamore:Sink', ':cycamore:Source']
+    exp = cd.build_facility_dictionary(metadata, archetypes)
+
+    cd.save_cached_metadata('abc', metadata, exp, str(tmp_path))
+    obs = cd.load_cached_metadata('abc', str(tmp_path))
+
+    assert obs["archetype_commods"] == exp
+    assert obs["metadata"] == metadata
+
+
+def test_cached_metadata_missing(tmp_path):
+    assert cd.load_cached_metadata('abc', str(tmp_path)) is None
+
+
+def test_cached_metadata_prunes_stale_entries(tmp_path):
+    cd.save_cached_metadata('old', metadata, {}, str(tmp_path))
+    (tmp_path / 'notes.json').write_text('{}')
+
+    cd.save_cached_metadata('new', metadata, {}, str(tmp_path))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['metadata-new.json',
+                                                          'notes.json']
+
+
+@pytest.fixture
+def stub_cyclus(monkeypatch, tmp_path):
+    '''Installs a stub cyclus.lib whose archetype library lives in
+    tmp_path / 'lib' and which counts metadata discoveries
+    '''
+    (tmp_path / 'lib').mkdir()
+    library = make_library(tmp_path / 'lib', 'libagents.so', b'agents')
+    module_file = make_library(tmp_path, 'lib.py', b'')
+
+    lib = types.ModuleType('cyclus.lib')
+    lib.__file__ = str(module_file)
+    lib.discoveries = 0
+
+    class Env:
+        install_path = str(tmp_path)
+        cyclus_path = [str(tmp_path / 'lib')]
+
+    def discover_metadata_in_cyclus_path():
+        lib.discoveries += 1
+        return metadata
+
+    lib.Env = Env
+    lib.discover_metadata_in_cyclus_path = discover_metadata_in_cyclus_path
+    lib.library = library
+    cyclus = types.ModuleType('cyclus')
+    cyclus.lib = lib
+    monkeypatch.setitem(sys.modules, 'cyclus', cyclus)
+    monkeypatch.setitem(sys.modules, 'cyclus.lib', lib)
+    return lib
+
+
+def test_build_commod_dictionary_cache(stub_cyclus, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    exp = cd.build_facility_dictionary(metadata, specs)
+
+    miss = cd.build_commod_dictionary(cache_dir=str(cache_dir))
+    hit = cd.build_commod_dictionary(cache_dir=str(cache_dir))
+
+    assert miss == hit == exp
+    assert stub_cyclus.discoveries == 1
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_build_commod_dictionary_cache_invalidated(stub_cyclus, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cd.build_commod_dictionary(cache_dir=str(cache_dir))
+    (entry,) = cache_dir.iterdir()
+
+    stub_cyclus.library.write_bytes(b'rebuilt agents')
+    cd.build_commod_dictionary(cache_dir=str(cache_dir))
+
+    assert stub_cyclus.discoveries == 2
+    (new_entry,) = cache_dir.iterdir()
+    assert new_entry != entry
+
+
+def test_build_commod_dictionary_no_cache(stub_cyclus, tmp_path):
+    cache_dir = tmp_path / 'cache'
+
+    obs = cd.build_commod_dictionary(use_cache=False,
+                                     cache_dir=str(cache_dir))
+
+    assert obs == cd.build_facility_dictionary(metadata, specs)
+    assert not cache_dir.exists()
+
+
+def test_build_commod_dictionary_unwritable_cache(stub_cyclus, tmp_path,
+                                                  capsys):
+    # a file in place of the cache directory cannot be written to
+    cache_dir = tmp_path / 'cache'
+    cache_dir.write_text('')
+
+    obs = cd.build_commod_dictionary(cache_dir=str(cache_dir))
+
+    assert obs == cd.build_facility_dictionary(metadata, specs)
+    assert 'could not cache metadata' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("annotation,exp", [({"uitype": "incommodity"},
+                                             ["incommodity"]),
+                                            ({"uitype": ["oneormore",
+                                                         "outcommodity"]},
+                                             ["oneormore", "outcommodity"]),
+                                            ({"uitype": ["oneormore",
+                                                         ["pair", "double",
+                                                          "incommodity"]]},
+                                             ["oneormore"]),
+                                            ({"type": "double"}, [])])
+def test_get_uitypes(annotation, exp):
+    assert cd.get_uitypes(annotation) == exp
+
+
+def test_build_uitype_index():
+    index = cd.build_uitype_index(metadata["annotations"])
+
+    assert index["incommodity"][':cycamore:Storage'] == ['in_commods']
+    assert index["outcommodity"][':cycamore:Enrichment'] == ['product_commod',
+                                                             'tails_commod']
+    assert index["inrecipe"][':cycamore:FuelFab'] == ['fill_recipe',
+                                                      'fiss_recipe',
+                                                      'topup_recipe']
+    assert ':cycamore:Mixer' not in index["incommodity"]
+
+
+def test_build_facility_dictionary_recipes():
+    archetypes = [':cycamore:Reactor', ':cycamore:Source']
+    exp = {':cycamore:Reactor': (['fuel_inrecipes', 'recipe_change_in'],
+                                 ['fuel_outrecipes', 'recipe_change_out']),
+           ':cycamore:Source': ([], ['outrecipe'])}
+
+    obs = cd.build_facility_dictionary(metadata, archetypes,
+                                       uitypes=("inrecipe", "outrecipe"))
+    assert obs == exp
+
+
+def test_lazy_commod_dictionary_matches_eager():
+    lazy = cd.LazyCommodDictionary(metadata)
+
+    assert lazy.resolved == []
+    assert len(lazy) == len(specs)
+    assert list(lazy) == specs
+    assert lazy == cd.build_facility_dictionary(metadata, specs)
+
+
+def test_lazy_commod_dictionary_resolves_on_lookup():
+    lazy = cd.LazyCommodDictionary(metadata)
+
+    assert lazy[':cycamore:Storage'] == (['in_commods'], ['out_commods'])
+    assert lazy[':cycamore:Storage'] is lazy[':cycamore:Storage']
+    assert ':cycamore:Sink' in lazy
+    assert lazy.resolved == [':cycamore:Storage']
+
+
+def test_lazy_commod_dictionary_missing():
+    lazy = cd.LazyCommodDictionary(metadata, archetypes=[':cycamore:Sink'])
+
+    assert ':cycamore:Source' not in lazy
+    with pytest.raises(KeyError):
+        lazy[':cycamore:Source']
@@ -0,0 +1,56 @@
+import trailmap.graph_core as gc
+import trailmap.acquisition_paths as ap
+import trailmap.pathway_analysis as pa
+import networkx as nx
+import pytest
+from tests.ap_data import testdata, random_graph
+# testdata format
+# name, edges, facility_dict_in, facility_dict_out, exp_paths
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_build_compact_graph(name, edges, fd_in, fd_out, exp_paths):
+    G = ap.build_graph(fd_in, fd_out)
+
+    CG = gc.build_compact_graph(G)
+
+    assert CG.number_of_nodes() == G.number_of_nodes()
+    obs = set((CG.names[u], CG.names[v]) for u in range(len(CG.names))
+              for v in CG.successors(u))
+    assert obs == set(G.edges())
+
+
+def test_build_compact_graph_commodities():
+    fd_in = {'Mine': [], 'Enrich': ['nat_u'], 'Reactor': ['leu', 'heu'],
+             'Weapon': ['heu']}
+    fd_out = {'Mine': ['nat_u'], 'Enrich': ['leu', 'heu'], 'Reactor': [],
+              'Weapon': []}
+
+    for G in [ap.build_graph(fd_in, fd_out),
+              ap.build_bipartite_graph(fd_in, fd_out)]:
+        CG = gc.build_compact_graph(G)
+        (enrich, reactor) = CG.get_ids(['Enrich', 'Reactor'])
+
+        assert CG.number_of_edges() == 3
+        assert sorted(CG.get_edge_commodities(enrich, reactor)) == ['heu',
+                                                                    'leu']
+        assert CG.get_edge_commodities(reactor, enrich) == []
+
+
+def test_id_paths_with_filters():
+    G = random_graph(3)
+    CG = gc.build_compact_graph(G)
+
+    pathways = (CG.get_id_path(path)
+                for path in ap.iter_simple_paths(G, 0, [6, 9]))
+    obs = pa.find_paths_with_sink(pathways, CG.get_id(9))
+
+    assert set(CG.get_names(path) for path in obs) == \
+        ap.find_simple_paths(G, 0, 9)
+
+
+def test_missing_node():
+    CG = gc.build_compact_graph(nx.MultiDiGraph([("A", "B")]))
+
+    with pytest.raises(nx.NodeNotFound):
+        CG.get_id_path(("A", "C"))
@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+import pytest
+
+# Wall-clock budget in seconds for importing trailmap and running
+# scripts/main.py with --metadata. Importing cyclus or matplotlib alone
+# exceeds it.
+STARTUP_BUDGET = 1.5
+
+# modules that a run with --metadata must never import
+DEFERRED_MODULES = ['cyclus', 'matplotlib', 'numpy']
+
+RUN_MAIN = '''
+import json, runpy, sys, time
+start = time.perf_counter()
+sys.argv = {argv!r}
+try:
+    runpy.run_path('scripts/main.py', run_name='__main__')
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed,
+                  'modules': sorted(m for m in sys.modules
+                                    if m.split('.')[0] in {deferred!r})}}))
+'''
+
+
+def run_isolated(argv):
+    code = RUN_MAIN.format(argv=argv, deferred=DEFERRED_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize("infile", ['input/source_1_sink_1.xml',
+                                    'input/toy_front_end.xml'])
+def test_metadata_run_defers_imports(infile):
+    obs = run_isolated(['main.py', infile, '--metadata', 'tests/metadata.json',
+                        '--supress-print'])
+
+    assert obs['modules'] == []
+
+
+def test_metadata_run_startup_budget():
+    # the best of a few runs keeps a busy machine from failing the test
+    elapsed = min(run_isolated(['main.py', 'input/toy_front_end.xml',
+                                '--metadata', 'tests/metadata.json',
+                                '--supress-print'])['elapsed']
+                  for i in range(3))
+
+    assert elapsed < STARTUP_BUDGET
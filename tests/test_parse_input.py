@@ -1,5 +1,7 @@
+import json
 import pytest
 import trailmap.parse_input as pi
+import trailmap.commodity_dictionary as cd
 import xml.etree.ElementTree as ET
 
 
@@ -38,6 +40,21 @@ def test_find_archetypes(exp_archetypes, test_file):
     assert obs_archetypes == exp_archetypes
 
 
+def test_archetype_spec_without_lib():
+    archetypes = ET.fromstring('<archetypes><spec><lib>cycamore</lib>'
+                               '<name>Sink</name></spec><spec>'
+                               '<name>Custom</name></spec></archetypes>')
+    simulation = {'archetypes': {'spec': [{'lib': 'cycamore',
+                                           'name': 'Sink'},
+                                          {'name': 'Custom'}]}}
+    exp = {'Sink': ':cycamore:Sink', 'Custom': ':Custom:Custom'}
+
+    assert pi.read_archetype_specs(archetypes) == exp
+    assert pi.get_archetypes_in_dict(simulation) == exp
+    with pytest.raises(ValueError):
+        pi.get_archetypes_in_dict({'archetypes': {'spec': {'lib': 'a'}}})
+
+
 def test_facility_dict_in():
     tree = ET.parse('input/source_1_sink_1.xml')
     root = tree.getroot()
@@ -79,3 +96,176 @@ def test_facility_dict_out():
                                                          commod_dict)
 
     assert obs_out == exp_out
+
+
+with open('tests/metadata.json') as f:
+    metadata = json.load(f)
+
+
+@pytest.mark.parametrize("test_file", ['input/source_1_sink_1.xml',
+                                       'input/source_3_sink_2.xml',
+                                       'input/toy_front_end.xml'])
+def test_iterparse_input(test_file):
+    commod_dict = cd.LazyCommodDictionary(metadata)
+    exp = pi.parse_input(test_file, commod_dict)
+
+    obs = pi.parse_input(test_file, commod_dict, stream=True)
+
+    assert obs == exp
+    assert list(obs[0]) == list(exp[0])
+
+
+def test_iterparse_input_facility_before_archetypes(tmp_path):
+    commod_dict = {':cycamore:Sink': (['in_commods'], []),
+                   ':cycamore:Source': ([], ['outcommod'])}
+    tree = ET.parse('input/source_1_sink_1.xml')
+    root = tree.getroot()
+    archetypes = root.find('archetypes')
+    root.remove(archetypes)
+    root.append(archetypes)
+    test_file = tmp_path / 'archetypes_last.xml'
+    tree.write(test_file)
+
+    obs = pi.iterparse_input(str(test_file), commod_dict)
+
+    assert obs == ({'SomeSource': [], 'SomeSink': ['commodity']},
+                   {'SomeSource': ['commodity'], 'SomeSink': []})
+
+
+def test_iterparse_input_no_archetypes(tmp_path):
+    test_file = tmp_path / 'no_archetypes.xml'
+    test_file.write_text('<simulation><facility><name>A</name><config>'
+                         '<Sink/></config></facility></simulation>')
+
+    with pytest.raises(ValueError):
+        pi.iterparse_input(str(test_file), {})
+
+
+def test_build_commod_extractor():
+    exp = {'feed_commods': (True, False),
+           'leftover_commod': (False, True),
+           'streams_': (False, True),
+           'streams': (False, True)}
+
+    obs = pi.build_commod_extractor(['feed_commods'],
+                                    ['leftover_commod', 'streams_'])
+    assert obs == exp
+
+
+@pytest.mark.parametrize("xml,exp", [('<outcommod>leu</outcommod>', ['leu']),
+                                     ('<in_commods><val>leu</val>'
+                                      '<val>heu</val></in_commods>',
+                                      ['leu', 'heu']),
+                                     ('<streams><item><commod>pu</commod>'
+                                      '<info><buf_size>1</buf_size></info>'
+                                      '</item><item><commod>u</commod>'
+                                      '<info><buf_size>1</buf_size></info>'
+                                      '</item></streams>', ['pu', 'u']),
+                                     ('<prefs><item><key>leu</key>'
+                                      '<val>1.0</val></item></prefs>',
+                                      ['leu'])])
+def test_get_commod_values(xml, exp):
+    assert pi.get_commod_values(ET.fromstring(xml)) == exp
+
+
+def test_facility_dict_map_commods():
+    root = ET.fromstring(
+        '<simulation><facility><name>Reprocess</name><config><Separations>'
+        '<feed_commods><val>used_fuel</val></feed_commods>'
+        '<leftover_commod>waste</leftover_commod>'
+        '<streams><item><commod>pu</commod><info><buf_size>1</buf_size>'
+        '<efficiencies><item><comp>Pu</comp><eff>0.99</eff></item>'
+        '</efficiencies></info></item></streams>'
+        '</Separations></config></facility></simulation>')
+    archetypes = {'Separations': ':cycamore:Separations'}
+    commod_dict = cd.LazyCommodDictionary(metadata)
+
+    obs = pi.get_facility_and_commod_names(root, archetypes, commod_dict)
+
+    assert obs == ({'Reprocess': ['used_fuel']},
+                   {'Reprocess': ['waste', 'pu']})
+
+
+def xml_to_dict(elem):
+    '''Converts an element to the JSON structure Cyclus uses for input'''
+    if len(elem) == 0:
+        return elem.text
+    d = {}
+    for child in elem:
+        value = xml_to_dict(child)
+        if child.tag in d:
+            if not isinstance(d[child.tag], list):
+                d[child.tag] = [d[child.tag]]
+            d[child.tag].append(value)
+        else:
+            d[child.tag] = value
+    return d
+
+
+@pytest.mark.parametrize("test_file", ['input/source_1_sink_1.xml',
+                                       'input/source_3_sink_2.xml',
+                                       'input/toy_front_end.xml'])
+def test_parse_json_input(test_file, tmp_path):
+    commod_dict = cd.LazyCommodDictionary(metadata)
+    root = ET.parse(test_file).getroot()
+    json_file = tmp_path / 'input.json'
+    json_file.write_text(json.dumps({'simulation': xml_to_dict(root)}))
+
+    obs = pi.parse_input(str(json_file), commod_dict)
+
+    assert obs == pi.parse_input(test_file, commod_dict)
+
+
+@pytest.mark.parametrize("simulation", ["{'simulation': %r}",
+                                        "json.dumps({'simulation': %r})"])
+def test_parse_py_input(simulation, tmp_path):
+    commod_dict = cd.LazyCommodDictionary(metadata)
+    root = ET.parse('input/toy_front_end.xml').getroot()
+    py_file = tmp_path / 'input.py'
+    py_file.write_text('import json\nsimulation = ' +
+                       simulation % xml_to_dict(root))
+
+    obs = pi.parse_input(str(py_file), commod_dict)
+
+    assert obs == pi.parse_input('input/toy_front_end.xml', commod_dict)
+
+
+def test_parse_py_input_xml_string(tmp_path):
+    commod_dict = cd.LazyCommodDictionary(metadata)
+    with open('input/source_1_sink_1.xml') as f:
+        xml = f.read()
+    py_file = tmp_path / 'input.py'
+    py_file.write_text('SIMULATION = %r' % xml)
+
+    obs = pi.parse_input(str(py_file), commod_dict)
+
+    assert obs == pi.parse_input('input/source_1_sink_1.xml', commod_dict)
+
+
+def test_parse_py_input_no_simulation(tmp_path):
+    py_file = tmp_path / 'input.py'
+    py_file.write_text('x = 1')
+
+    with pytest.raises(ValueError):
+        pi.parse_input(str(py_file), {})
+
+
+@pytest.mark.parametrize("value,exp", [('leu', ['leu']),
+                                       ({'val': 'leu'}, ['leu']),
+                                       ({'val': ['leu', 'heu']},
+                                        ['leu', 'heu']),
+                                       ({'item': [{'commod': 'pu',
+                                                   'info': {'buf_size': 1}},
+                                                  {'commod': 'u',
+                                                   'info': {'buf_size': 1}}]},
+                                        ['pu', 'u']),
+                                       ({'item': {'key': 'leu', 'val': 1.0}},
+                                        ['leu'])])
+def test_get_commod_values_in_dict(value, exp):
+    assert pi.get_commod_values_in_dict(value) == exp
+
+
+@pytest.mark.parametrize("input,exp", [('in.xml', 'xml'), ('in.JSON', 'json'),
+                                       ('dir/in.py', 'py'), ('in', 'xml')])
+def test_detect_input_format(input, exp):
+    assert pi.detect_input_format(input) == exp
@@ -1,9 +1,12 @@
 import io
 import sys
+import random
 import trailmap.pathway_analysis as pa
+import trailmap.acquisition_paths as ap
 import networkx as nx
 import pytest
 from tests.pa_data import testdata
+from tests.ap_data import random_graph
 import collections
 from math import inf
 # name, short, long, semiconnect, hierarchy, edges, paths, sc
@@ -552,3 +555,539 @@ def test_get_longest_paths(name, short, long, edges, paths, sc):
     exp = {path for path in paths if len(path) == long}
     obs = pa.get_longest_path(paths)
     assert obs == exp
+
+
+def test_is_pathway_stream():
+    pathways = {(0, 1), (0, 2)}
+
+    assert pa.is_pathway_stream(iter(pathways))
+    assert pa.is_pathway_stream(path for path in pathways)
+    assert not pa.is_pathway_stream(pathways)
+    assert not pa.is_pathway_stream(list(pathways))
+
+
+@pytest.mark.parametrize("query,arg", [(pa.find_paths_with_source, "SourceA"),
+                                       (pa.find_paths_with_sink, "SinkB"),
+                                       (pa.find_paths_containing_all,
+                                        ["SourceB", "SinkB"]),
+                                       (pa.find_paths_containing_all, []),
+                                       (pa.find_paths_containing_one_of,
+                                        ["SourceA", "SinkA"]),
+                                       (pa.find_paths_containing_one_of, [])])
+def test_filters_accept_streams(query, arg):
+    pathways = testdata[2][4]
+
+    obs = query(iter(pathways), arg)
+
+    assert pa.is_pathway_stream(obs)
+    assert set(obs) == query(pathways, arg)
+
+
+@pytest.mark.parametrize("name, short, long, edges, paths, sc", testdata)
+def test_summarize_pathways(name, short, long, edges, paths, sc):
+    (num_paths, shortest, longest) = pa.summarize_pathways(iter(paths))
+
+    assert num_paths == len(paths)
+    assert shortest == pa.get_shortest_path(paths)
+    assert longest == pa.get_longest_path(iter(paths))
+
+
+def test_stream_analysis():
+    G = nx.MultiDiGraph()
+    G.add_edges_from([("Mine", "Enrich"), ("Enrich", "Reactor"),
+                      ("Enrich", "Collector"), ("Reactor", "Reprocess"),
+                      ("Reprocess", "Collector"), ("Reprocess", "Repository"),
+                      ("Reactor", "Repository")])
+    pathways = ap.iter_simple_paths(G, ["Mine"], ["Collector", "Repository"])
+
+    obs = pa.get_shortest_path(
+        pa.find_paths_containing_one_of(
+            pa.find_paths_with_sink(pathways, "Collector"), "Reactor"))
+
+    assert obs == {("Mine", "Enrich", "Reactor", "Reprocess", "Collector")}
+
+
+def test_can_reach():
+    fd_in = {'Mine': [], 'Enrich': ['nat_u'], 'Reactor': ['leu'],
+             'Storage': ['used_fuel'], 'Weapon': ['heu']}
+    fd_out = {'Mine': ['nat_u'], 'Enrich': ['leu', 'heu'],
+              'Reactor': ['used_fuel'], 'Storage': [], 'Weapon': []}
+    for G in [ap.build_graph(fd_in, fd_out),
+              ap.build_bipartite_graph(fd_in, fd_out)]:
+        index = ap.ReachabilityIndex(G)
+
+        assert pa.can_reach(G, 'Mine', 'Weapon')
+        assert pa.can_reach(G, 'Mine', 'Storage', index=index)
+        assert not pa.can_reach(G, 'Reactor', 'Weapon')
+        assert not pa.can_reach(G, 'Storage', 'Mine', index=index)
+
+
+def test_match_signatures():
+    pathways = {('Source', 'FacilityA', 'FacilityB', 'Sink'),
+                ('Source', 'FacilityB', 'FacilityA', 'Sink')}
+    signatures = [('FacilityA', 'FacilityB'), ('FacilityA', 'Sink'),
+                  ('Sink',), (), ('Source', 'FacilityA', 'FacilityB', 'Sink')]
+
+    obs = pa.match_signatures(pathways, signatures)
+
+    assert obs == {('Source', 'FacilityA', 'FacilityB', 'Sink'):
+                   (1, -1, 3, -1, 0),
+                   ('Source', 'FacilityB', 'FacilityA', 'Sink'):
+                   (-1, 2, 3, -1, -1)}
+
+
+def test_match_signatures_stream():
+    pathways = [(0, 1, 2, 3), (0, 2, 3)]
+
+    obs = pa.match_signatures(iter(pathways), [(2, 3), (1, 2)])
+
+    assert pa.is_pathway_stream(obs)
+    assert list(obs) == [((0, 1, 2, 3), (2, 1)), ((0, 2, 3), (1, -1))]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_match_signatures_matches_check_if_sublist(seed):
+    rng = random.Random(seed)
+    pathways = set(tuple(rng.choice('abc') for i in range(rng.randint(0, 12)))
+                   for j in range(30))
+    signatures = [tuple(rng.choice('abc') for i in range(rng.randint(0, 4)))
+                  for j in range(15)]
+
+    obs = pa.match_signatures(pathways, signatures)
+
+    for path in pathways:
+        assert obs[path] == tuple(pa.check_if_sublist(path, signature)
+                                  for signature in signatures)
+
+
+def test_find_pathway_flows():
+    G = nx.DiGraph()
+    G.add_edges_from([(0, 1, {'capacity': 3}), (1, 2, {'capacity': 5}),
+                      (2, 3, {'capacity': 3}), (3, 4, {'capacity': 4}),
+                      (0, 5, {'capacity': 2}), (5, 6, {'capacity': 3}),
+                      (6, 3, {'capacity': 2}), (3, 7, {'capacity': 1}),
+                      (7, 4, {'capacity': 2}), (4, 8), (8, 9)])
+    pathways = {(0, 5, 6, 3, 7), (0, 1, 2, 3, 4), (3, 4, 8), (4, 8, 9), (9,)}
+
+    obs = pa.find_pathway_flows(G, pathways)
+
+    assert obs == {(0, 5, 6, 3, 7): (1, (3, 7)),
+                   (0, 1, 2, 3, 4): (3, (0, 1)),
+                   (3, 4, 8): (4, (3, 4)),
+                   (4, 8, 9): (inf, None),
+                   (9,): (inf, None)}
+    for path in [(0, 5, 6, 3, 7), (0, 1, 2, 3, 4), (3, 4, 8)]:
+        assert obs[path][0] == pa.find_pathway_flow(G, path)
+
+
+def test_find_pathway_flows_stream():
+    G = nx.DiGraph()
+    G.add_edges_from([(0, 1, {'capacity': 3}), (1, 2, {'capacity': 2})])
+
+    obs = pa.find_pathway_flows(G, iter([(0, 1, 2), (0, 1)]))
+
+    assert pa.is_pathway_stream(obs)
+    assert list(obs) == [((0, 1, 2), (2, (1, 2))), ((0, 1), (3, (0, 1)))]
+
+
+def test_find_pathway_flows_errors():
+    G = nx.DiGraph([(0, 1), (1, 2)])
+
+    with pytest.raises(nx.NetworkXError):
+        pa.find_pathway_flows(G, {(0, 2)})
+    with pytest.raises(TypeError):
+        pa.find_pathway_flows(nx.MultiDiGraph(G), {(0, 1)})
+    with pytest.raises(TypeError):
+        pa.find_pathway_flows(nx.Graph(G), {(0, 1)})
+
+
+def flow_graph():
+    G = nx.DiGraph()
+    G.add_edges_from([('a', 'c', {'capacity': 3}), ('b', 'c', {'capacity': 4}),
+                      ('c', 'd', {'capacity': 5}), ('c', 'e', {'capacity': 1}),
+                      ('d', 'e', {'capacity': 2}), ('b', 'f', {'capacity': 2}),
+                      ('d', 'c', {'capacity': 2})])
+    return G
+
+
+def test_find_aggregate_flow():
+    G = flow_graph()
+
+    (obs_value, obs_flow, obs_paths) = pa.find_aggregate_flow(
+        G, ['a', 'b'], ['d', 'e', 'f'])
+
+    assert obs_value == 8
+    assert set(obs_flow) == set(G)
+    assert sum(flow for path, flow in obs_paths) == obs_value
+    used = collections.Counter()
+    for path, flow in obs_paths:
+        assert path[0] in ['a', 'b'] and path[-1] in ['d', 'e', 'f']
+        for u, v in zip(path, path[1:]):
+            used[(u, v)] += flow
+    for (u, v), flow in used.items():
+        assert flow <= G.edges[u, v]['capacity']
+
+
+def test_decompose_flow_cycle():
+    flow_dict = {'s': {'a': 2}, 'a': {'b': 3}, 'b': {'a': 1, 't': 2},
+                 't': {}}
+
+    obs = pa.decompose_flow(flow_dict, 's', 't')
+
+    assert obs == [(('s', 'a', 'b', 't'), 2)]
+    assert flow_dict['a'] == {'b': 3}
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_find_flow_matrix(processes):
+    G = flow_graph()
+    sources = ['a', 'b', 'c']
+    sinks = ['c', 'e', 'f']
+
+    obs = pa.find_flow_matrix(G, sources, sinks, processes=processes)
+
+    exp = {(s, t): nx.maximum_flow_value(G, s, t)
+           for s in sources for t in sinks if s != t}
+    assert obs == exp
+
+
+def test_find_flow_matrix_unbounded():
+    G = nx.DiGraph([(0, 1), (1, 2)])
+    G.add_edge(3, 2, capacity=1)
+
+    obs = pa.find_flow_matrix(G, [0, 3], [2], processes=1)
+
+    assert obs == {(0, 2): inf, (3, 2): 1}
+
+
+def test_find_flow_matrix_multiedges():
+    with pytest.raises(TypeError):
+        pa.find_flow_matrix(nx.MultiDiGraph([(0, 1)]), [0], [1])
+
+
+def test_has_multiedges_self_loop():
+    G = nx.MultiDiGraph([('a', 'a'), ('a', 'b'), ('b', 'a')])
+
+    assert pa.has_multiedges(G) is False
+
+
+def test_reduce_multidigraph():
+    G = nx.MultiDiGraph()
+    G.add_edge('a', 'b', commodity='leu', capacity=2)
+    G.add_edge('a', 'b', commodity='heu', capacity=1)
+    G.add_edge('b', 'c', commodity='used_fuel', capacity=5)
+    G.add_edge('c', 'd', commodity='pu')
+    G.add_edge('c', 'd', commodity='am', capacity=1)
+    G.add_node('e')
+
+    (H, multiedges) = pa.reduce_multidigraph(G)
+
+    assert type(H) == nx.DiGraph
+    assert set(H.nodes()) == set(G.nodes())
+    assert H.edges['a', 'b'] == {'commodity': ['leu', 'heu'], 'capacity': 3}
+    assert H.edges['b', 'c'] == {'commodity': ['used_fuel'], 'capacity': 5}
+    assert H.edges['c', 'd'] == {'commodity': ['pu', 'am']}
+    assert multiedges == {('a', 'b'): 2, ('c', 'd'): 2}
+
+
+def test_reduce_multidigraph_formats():
+    G = nx.DiGraph([('a', 'b')])
+
+    assert pa.reduce_multidigraph(G) == (G, {})
+    with pytest.raises(TypeError):
+        pa.reduce_multidigraph(nx.MultiGraph([('a', 'b')]))
+
+
+def test_flow_aggregate_multiedges():
+    G = nx.MultiDiGraph()
+    G.add_edge('a', 'b', capacity=2)
+    G.add_edge('a', 'b', capacity=1)
+    G.add_edge('b', 'c', capacity=5)
+
+    (obs_path, obs) = pa.find_maximum_flow(G, 'a', 'c', aggregate=True)
+
+    assert obs == 3
+    assert pa.find_pathway_flow(G, ('a', 'b', 'c'), aggregate=True) == 3
+    assert (pa.find_pathway_flows(G, {('a', 'b', 'c')}, aggregate=True)
+            == {('a', 'b', 'c'): (3, ('a', 'b'))})
+    with pytest.raises(TypeError):
+        pa.find_maximum_flow(G, 'a', 'c')
+
+
+def test_find_simple_cycles():
+    G = nx.DiGraph([(0, 1), (1, 0), (1, 2), (2, 3), (3, 1), (3, 3), (3, 4),
+                    (4, 4)])
+
+    obs = pa.find_simple_cycles(G)
+
+    assert sorted(sorted(cycle) for cycle in obs) == [[0, 1], [1, 2, 3], [3],
+                                                      [4]]
+
+
+@pytest.mark.parametrize("length_bound", [1, 2, 3])
+def test_find_simple_cycles_length_bound(length_bound):
+    G = nx.DiGraph(nx.complete_graph(5, create_using=nx.DiGraph))
+    G.add_edge(0, 0)
+
+    obs = pa.find_simple_cycles(G, length_bound=length_bound)
+
+    exp = [c for c in nx.simple_cycles(G) if len(c) <= length_bound]
+    assert sorted(map(sorted, obs)) == sorted(map(sorted, exp))
+
+
+def test_find_simple_cycles_max_cycles():
+    G = nx.DiGraph(nx.complete_graph(6, create_using=nx.DiGraph))
+
+    assert len(pa.find_simple_cycles(G, max_cycles=10)) == 10
+    assert pa.find_simple_cycles(G, max_cycles=0) == []
+
+
+def test_build_cycle_index():
+    obs = pa.build_cycle_index([[5, 6], [3, 4, 7], [7]])
+
+    assert obs == {5: [(0, 0)], 6: [(0, 1)], 3: [(1, 0)], 4: [(1, 1)],
+                   7: [(1, 2), (2, 0)]}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_rolled_cycles_matches_roll_cycle(seed):
+    G = random_graph(seed, 8, 0.3, nx.DiGraph)
+    sc = pa.find_simple_cycles(G, length_bound=4)
+    index = pa.build_cycle_index(sc)
+
+    for path in [(0, 1, 2, 3), (4, 5, 6, 7), (7, 0, 2, 4, 6)]:
+        exp = {}
+        for cycle in sc:
+            rolled = pa.roll_cycle(path, cycle)
+            if rolled:
+                exp[rolled] = None
+        exp = sorted(exp, key=len, reverse=True)
+
+        assert pa.get_rolled_cycles(path, sc, index) == exp
+
+
+def test_iter_pathways_with_cycles():
+    pathways = [(0, 2, 6, 7, 8), (0, 1, 9)]
+    sc = [[5, 6], [3, 4, 7], [7]]
+
+    obs = list(pa.iter_pathways_with_cycles(pathways, sc))
+
+    assert obs == [(0, 2, 6, (7,), 7, 8),
+                   (0, 2, (6, 5), 6, 7, 8),
+                   (0, 2, 6, (7, 3, 4), 7, 8),
+                   (0, 2, (6, 5), 6, (7,), 7, 8),
+                   (0, 2, 6, (7, 3, 4), (7,), 7, 8),
+                   (0, 2, (6, 5), 6, (7, 3, 4), 7, 8),
+                   (0, 2, (6, 5), 6, (7, 3, 4), (7,), 7, 8)]
+    assert obs[-1] in pa.get_pathways_with_cycles(pathways, sc)
+
+
+def test_iter_pathways_with_cycles_limits():
+    pathways = {(0, 1, 3, 4, 7, 8), (0, 2, 6, 7, 8)}
+    sc = [[5, 6], [3, 4, 7], [7], [1]]
+
+    one_cycle = list(pa.iter_pathways_with_cycles(pathways, sc,
+                                                  max_cycles=1))
+    first = list(pa.iter_pathways_with_cycles(iter(pathways), sc,
+                                              max_variants=3))
+
+    assert len(one_cycle) == 6
+    assert first == one_cycle[:3]
+    lengths = [sum(len(step) if isinstance(step, tuple) else 1
+                   for step in variant) for variant in one_cycle]
+    assert lengths == sorted(lengths)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_iter_pathways_with_cycles_all_subsets(seed):
+    G = random_graph(seed, 8, 0.35, nx.DiGraph)
+    sc = pa.find_simple_cycles(G, length_bound=3)
+    pathways = {(0, 1, 2, 3), (4, 5, 6, 7), (7, 0, 2, 4, 6)}
+    index = pa.build_cycle_index(sc)
+    n_cycles = [len(pa.get_rolled_cycles(path, sc, index))
+                for path in pathways]
+
+    obs = list(pa.iter_pathways_with_cycles(pathways, sc))
+
+    assert len(obs) == len(set(obs)) == sum(2 ** n - 1 for n in n_cycles)
+    counts = [sum(isinstance(step, tuple) for step in variant)
+              for variant in obs]
+    assert counts == sorted(counts)
+
+
+def chokepoint_graph(seed):
+    '''Random acyclic-ish MultiDiGraph with one or two commodities per edge'''
+    rng = random.Random(seed)
+    D = random_graph(seed, 9, 0.3, nx.DiGraph)
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(D)
+    for u, v in D.edges():
+        for commod in rng.sample(['a', 'b', 'c'], rng.choice([1, 1, 2])):
+            G.add_edge(u, v, commodity=commod)
+    return G
+
+
+def expected_chokepoints(G, pathways):
+    '''Reference chokepoints by intersecting enumerated pathways'''
+    if not pathways:
+        return set(), set()
+    facilities = set.intersection(*(set(path) for path in pathways))
+    steps = set.intersection(*(set(zip(path, path[1:]))
+                               for path in pathways))
+    edges = set()
+    for u, v in steps:
+        commods = set(data.get('commodity') for data in G[u][v].values())
+        if len(commods) == 1:
+            edges.add((u, v, commods.pop()))
+    return facilities, edges
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_find_chokepoints(seed):
+    G = chokepoint_graph(seed)
+    sources = [0, 1, 2]
+    sinks = [6, 7, 8]
+
+    obs = pa.find_chokepoints(G, sources, sinks)
+
+    for source in sources:
+        for sink in sinks:
+            pathways = ap.find_simple_paths(G, source, sink)
+            (exp_facilities, exp_edges) = expected_chokepoints(G, pathways)
+            (facilities, edges) = obs[(source, sink)]
+            assert set(facilities) == exp_facilities
+            assert set(edges) == exp_edges
+            for path in pathways:
+                assert [n for n in path if n in exp_facilities] == facilities
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_find_source_and_global_chokepoints(seed):
+    G = chokepoint_graph(seed)
+    sources = [0, 1, 2]
+    sinks = [6, 7, 8]
+
+    obs = pa.find_source_chokepoints(G, sources, sinks)
+    (obs_facilities, obs_edges) = pa.find_global_chokepoints(G, sources,
+                                                             sinks)
+
+    for source in sources:
+        pathways = ap.find_simple_paths(G, source, sinks)
+        (exp_facilities, exp_edges) = expected_chokepoints(G, pathways)
+        assert set(obs[source][0]) == exp_facilities
+        assert set(obs[source][1]) == exp_edges
+    pathways = ap.find_simple_paths(G, sources, sinks)
+    (exp_facilities, exp_edges) = expected_chokepoints(G, pathways)
+    assert set(obs_facilities) == exp_facilities
+    assert set(obs_edges) == exp_edges
+
+
+def test_find_chokepoints_fuel_cycle():
+    fd_in = {'Mine': [], 'Mill': ['ore'], 'Enrich': ['yellowcake'],
+             'Reactor': ['leu', 'heu'], 'Weapon': ['heu'],
+             'Repository': ['used_fuel']}
+    fd_out = {'Mine': ['ore'], 'Mill': ['yellowcake'],
+              'Enrich': ['leu', 'heu'], 'Reactor': ['used_fuel'],
+              'Weapon': [], 'Repository': []}
+    for G in [ap.build_graph(fd_in, fd_out),
+              ap.build_bipartite_graph(fd_in, fd_out)]:
+        obs = pa.find_chokepoints(G)
+
+        assert obs[('Mine', 'Repository')] == (
+            ['Mine', 'Mill', 'Enrich', 'Reactor', 'Repository'],
+            [('Mine', 'Mill', 'ore'), ('Mill', 'Enrich', 'yellowcake'),
+             ('Reactor', 'Repository', 'used_fuel')])
+        assert obs[('Mine', 'Weapon')][1][-1] == ('Enrich', 'Weapon', 'heu')
+        assert pa.find_global_chokepoints(G) == (
+            ['Mine', 'Mill', 'Enrich'],
+            [('Mine', 'Mill', 'ore'), ('Mill', 'Enrich', 'yellowcake')])
+
+
+def test_find_chokepoints_no_pathway():
+    G = nx.MultiDiGraph([('A', 'B'), ('C', 'D')])
+
+    obs = pa.find_chokepoints(G)
+
+    assert obs[('A', 'D')] == ([], [])
+    assert obs[('A', 'B')] == (['A', 'B'], [('A', 'B', None)])
+    with pytest.raises(nx.NodeNotFound):
+        pa.find_chokepoints(G, 'A', 'E')
+
+
+def test_print_graph_parameters_no_pathways(capsys):
+    G = nx.MultiDiGraph([("A", "B")])
+    pathways = ap.find_simple_paths(G, "A", "B", max_paths=0)
+
+    pa.print_graph_parameters(G, pathways)
+
+    assert "A total of 0 pathways" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("fd_in, fd_out",
+                         [({'A': [], 'B': ['x', 'y']},
+                           {'A': ['x', 'y'], 'B': []}),
+                          ({'A': ['y'], 'B': ['x'], 'C': ['x']},
+                           {'A': ['x'], 'B': ['y'], 'C': []})])
+def test_print_graph_parameters_bipartite(capsys, fd_in, fd_out):
+    G = ap.build_graph(fd_in, fd_out)
+    B = ap.build_bipartite_graph(fd_in, fd_out)
+    sources = ap.get_facility_nodes(G)
+
+    pa.print_graph_parameters(G, ap.find_simple_paths(G, sources, sources))
+    exp = capsys.readouterr().out
+    pa.print_graph_parameters(B, ap.find_simple_paths(B, sources, sources))
+
+    assert capsys.readouterr().out == exp
+
+
+def test_find_aggregate_flow_source_and_sink():
+    G = nx.DiGraph()
+    G.add_edge('A', 'B', capacity=2)
+    G.add_edge('B', 'C', capacity=3)
+    G.add_node('Iso')
+
+    (obs_value, obs_flow, obs_paths) = pa.find_aggregate_flow(
+        G, pa.get_sources(G), pa.get_sinks(G))
+
+    assert obs_value == 2
+    assert obs_paths == [(('A', 'B', 'C'), 2)]
+
+
+def test_find_aggregate_flow_unbounded():
+    G = nx.DiGraph([('A', 'B'), ('B', 'C')])
+    G.add_edge('D', 'C', capacity=1)
+
+    obs = pa.find_aggregate_flow(G, ['A', 'D'], ['C'])
+
+    assert obs == (inf, None, None)
+    assert pa.find_flow_matrix(G, ['A'], ['C'], processes=1) == {
+        ('A', 'C'): inf}
+
+
+def bipartite_fuel_cycle():
+    fd_in = {'Mine': [], 'Enrich': ['nat_u', 'recycled_u'],
+             'Reactor': ['leu'], 'Reprocess': ['used_fuel']}
+    fd_out = {'Mine': ['nat_u'], 'Enrich': ['leu'],
+              'Reactor': ['used_fuel'], 'Reprocess': ['recycled_u']}
+    return (ap.build_graph(fd_in, fd_out),
+            ap.build_bipartite_graph(fd_in, fd_out))
+
+
+def test_bipartite_queries():
+    (G, B) = bipartite_fuel_cycle()
+    path = ('Mine', 'Enrich', 'Reactor')
+
+    (H, safe) = pa.transform_to_digraph(B)
+
+    assert safe
+    assert type(H) == nx.DiGraph
+    assert set(H.edges()) == set(G.edges())
+    assert H.edges['Enrich', 'Reactor']['commodity'] == ['leu']
+    assert pa.find_pathway_flows(B, {path}) == {path: (inf, None)}
+    assert pa.find_node_disjoint_paths(B, 'Mine', 'Reactor') == {path}
+    assert (sorted(map(sorted, pa.find_simple_cycles(B)))
+            == [['Enrich', 'Reactor', 'Reprocess']])
+    with pytest.raises(nx.NetworkXUnbounded):
+        pa.find_pathway_flow(B, path)
+    assert pa.find_flow_matrix(B, ['Mine'], ['Reactor'], processes=1) == {
+        ('Mine', 'Reactor'): inf}
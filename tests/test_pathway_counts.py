@@ -0,0 +1,157 @@
+import trailmap.pathway_counts as pc
+import trailmap.acquisition_paths as ap
+import networkx as nx
+import pytest
+from tests.ap_data import testdata, random_graph
+# testdata format
+# name, edges, facility_dict_in, facility_dict_out, exp_paths
+
+
+def diamond_chain(n):
+    '''n diamonds in series, so 2**n pathways from 0 to 3 * n'''
+    G = nx.MultiDiGraph()
+    for i in range(n):
+        a = 3 * i
+        G.add_edges_from([(a, a + 1), (a, a + 2), (a + 1, a + 3),
+                          (a + 2, a + 3)])
+    return G
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_count_all_pathways(name, edges, fd_in, fd_out, exp_paths):
+    G = ap.build_graph(fd_in, fd_out)
+
+    assert pc.count_all_pathways(G) == len(exp_paths)
+
+
+@pytest.mark.parametrize("name, edges, fd_in, fd_out, exp_paths", testdata)
+def test_count_all_pathways_bipartite(name, edges, fd_in, fd_out, exp_paths):
+    G = ap.build_bipartite_graph(fd_in, fd_out)
+
+    assert pc.count_all_pathways(G) == len(exp_paths)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_count_pathways_cyclic(seed):
+    G = random_graph(seed)
+    sources = [0, 1, 2]
+    sinks = [2, 6, 9]
+
+    obs = pc.count_pathways(G, sources, sinks)
+
+    for source in sources:
+        for sink in sinks:
+            exp = len(ap.find_simple_paths(G, source, sink))
+            assert obs[(source, sink)] == exp
+
+
+def test_count_pathways_large():
+    G = diamond_chain(200)
+
+    obs = pc.count_pathways(G)
+
+    assert obs == {(0, 600): 2 ** 200}
+
+
+def test_count_pathways_acyclic_enumerates_nothing():
+    G = diamond_chain(5)
+    (D, sources, sinks) = pc.get_counting_graph(G)
+    condensation = pc.CondensedGraph(D, sources)
+
+    assert condensation.count_paths_to(15)[0] == 32
+    assert condensation.scc_paths_enumerated == 0
+
+
+def test_count_pathways_scc_limit():
+    G = nx.MultiDiGraph(nx.complete_graph(8, create_using=nx.DiGraph))
+    G.add_edges_from([("Source", 0), (7, "Sink")])
+
+    with pytest.raises(ValueError):
+        pc.count_pathways(G, scc_path_limit=100)
+
+
+def test_count_pathways_unreachable():
+    G = nx.MultiDiGraph([("A", "B"), ("C", "D")])
+
+    obs = pc.count_pathways(G)
+
+    assert obs == {("A", "B"): 1, ("A", "D"): 0, ("C", "B"): 0,
+                   ("C", "D"): 1}
+
+
+def test_count_pathways_missing_node():
+    G = nx.MultiDiGraph([("A", "B")])
+
+    with pytest.raises(nx.NodeNotFound):
+        pc.count_pathways(G, "A", "C")
+
+
+def tally(G, sources, sinks):
+    '''Reference traversal counts from the enumerated pathways'''
+    node_counts = {node: 0 for node in G}
+    pair_counts = {}
+    for path in ap.find_simple_paths(G, sources, sinks):
+        for node in path:
+            node_counts[node] += 1
+        for step in zip(path, path[1:]):
+            pair_counts[step] = pair_counts.get(step, 0) + 1
+    return node_counts, pair_counts
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_count_pathway_traversals_acyclic(seed):
+    G = random_graph(seed, 12, 0.3)
+    G.remove_edges_from([(u, v) for u, v in list(G.edges()) if u >= v])
+    sources = [node for node, deg in G.in_degree() if deg == 0]
+    sinks = [node for node, deg in G.out_degree() if deg == 0] + [6]
+    (exp_nodes, exp_pairs) = tally(G, sources, sinks)
+
+    (obs_nodes, obs_edges) = pc.count_pathway_traversals(G, sources, sinks)
+
+    assert obs_nodes == exp_nodes
+    for (u, v, commod), count in obs_edges.items():
+        assert count == exp_pairs.get((u, v), 0)
+
+
+def test_count_pathway_traversals_commodities():
+    fd_in = {'Mine': [], 'Enrich': ['nat_u'], 'Reactor': ['leu', 'heu'],
+             'Repository': ['used_fuel'], 'Weapon': ['heu']}
+    fd_out = {'Mine': ['nat_u'], 'Enrich': ['leu', 'heu'],
+              'Reactor': ['used_fuel'], 'Repository': [], 'Weapon': []}
+    G = ap.build_bipartite_graph(fd_in, fd_out)
+
+    (obs_nodes, obs_edges) = pc.count_pathway_traversals(G)
+
+    assert obs_nodes == {'Mine': 2, 'Enrich': 2, 'Reactor': 1,
+                         'Repository': 1, 'Weapon': 1}
+    assert obs_edges == {('Mine', 'Enrich', 'nat_u'): 2,
+                         ('Enrich', 'Reactor', 'leu'): 1,
+                         ('Enrich', 'Reactor', 'heu'): 1,
+                         ('Enrich', 'Weapon', 'heu'): 1,
+                         ('Reactor', 'Repository', 'used_fuel'): 1}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_count_pathway_traversals_cyclic(seed):
+    G = random_graph(seed)
+    (exp_nodes, exp_pairs) = tally(G, [0, 1], [8, 9])
+
+    (obs_nodes, obs_edges) = pc.count_pathway_traversals(G, [0, 1], [8, 9])
+
+    assert obs_nodes == exp_nodes
+    for (u, v, commod), count in obs_edges.items():
+        assert count == exp_pairs.get((u, v), 0)
+
+
+def test_count_pathway_traversals_no_fallback():
+    G = nx.MultiDiGraph([("A", "B"), ("B", "C"), ("C", "B"), ("C", "D")])
+
+    with pytest.raises(ValueError):
+        pc.count_pathway_traversals(G, fallback=False)
+
+
+def test_count_pathway_traversals_max_paths():
+    G = nx.MultiDiGraph(nx.complete_graph(6, create_using=nx.DiGraph))
+
+    with pytest.raises(ValueError):
+        pc.count_pathway_traversals(G, [0], [5], max_paths=10)
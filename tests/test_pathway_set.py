@@ -0,0 +1,206 @@
+import trailmap.pathway_set as ps
+import trailmap.pathway_analysis as pa
+import trailmap.acquisition_paths as ap
+import trailmap.graph_core as gc
+import pytest
+from tests.pa_data import testdata
+from tests.ap_data import random_graph
+# testdata format
+# name, shortest path, longest path, edges, paths, simple cycles
+
+int_pathways = {(0, 1, 2, 3, 4), (0, 2, 3, 4), (0, 1, 5, 6, 4), (0, 1, 7, 4)}
+named_pathways = testdata[2][4]
+
+
+@pytest.mark.parametrize("name, short, long, edges, paths, sc", testdata)
+def test_build_pathway_set(name, short, long, edges, paths, sc):
+    obs = ps.build_pathway_set(paths)
+
+    assert len(obs) == len(paths)
+    assert obs == paths
+    assert sorted(obs.lengths.tolist()) == sorted(len(p) for p in paths)
+    for path in paths:
+        assert path in obs
+    assert ("Nowhere",) not in obs
+
+
+def test_build_pathway_set_from_ids():
+    G = random_graph(3)
+    CG = gc.build_compact_graph(G)
+
+    paths = (CG.get_id_path(path)
+             for path in ap.iter_simple_paths(G, [0], [6, 9]))
+
+    obs = ps.build_pathway_set(paths, names=CG.names)
+
+    assert obs == ap.find_simple_paths(G, [0], [6, 9])
+
+
+@pytest.mark.parametrize("query, arg", [(pa.find_paths_with_source, "SourceA"),
+                                        (pa.find_paths_with_source, "Nowhere"),
+                                        (pa.find_paths_with_sink, "SinkB"),
+                                        (pa.find_paths_containing_all,
+                                         ["SourceB", "SinkB"]),
+                                        (pa.find_paths_containing_all, []),
+                                        (pa.find_paths_containing_one_of,
+                                         ["SourceA", "SinkA"]),
+                                        (pa.find_paths_containing_one_of,
+                                         "Nowhere")])
+def test_filters(query, arg):
+    pathways = ps.build_pathway_set(named_pathways)
+
+    obs = query(pathways, arg)
+
+    assert isinstance(obs, ps.PathwaySet)
+    assert obs == query(named_pathways, arg)
+
+
+@pytest.mark.parametrize("contain", [5, [1, 5], [0, 3], [5, 7], [7, 8]])
+def test_filters_int(contain):
+    pathways = ps.build_pathway_set(int_pathways)
+
+    for query in [pa.find_paths_containing_all,
+                  pa.find_paths_containing_one_of]:
+        assert query(pathways, contain) == query(int_pathways, contain)
+
+
+def test_filters_chain_views():
+    pathways = ps.build_pathway_set(int_pathways)
+
+    obs = pa.find_paths_with_sink(
+        pa.find_paths_containing_one_of(pathways, [2, 7]), 4)
+
+    assert obs.nodes is pathways.nodes
+    assert obs == {(0, 1, 2, 3, 4), (0, 2, 3, 4), (0, 1, 7, 4)}
+    assert pa.get_shortest_path(obs) == {(0, 2, 3, 4), (0, 1, 7, 4)}
+
+
+def test_select_where():
+    pathways = ps.build_pathway_set(int_pathways)
+
+    obs = pa.select_pathways(pathways, lambda path: path[1] == 1)
+
+    assert isinstance(obs, ps.PathwaySet)
+    assert obs == {(0, 1, 2, 3, 4), (0, 1, 5, 6, 4), (0, 1, 7, 4)}
+
+
+@pytest.mark.parametrize("name, short, long, edges, paths, sc", testdata)
+def test_length_queries(name, short, long, edges, paths, sc):
+    pathways = ps.build_pathway_set(paths)
+
+    assert pathways.min_length() == short
+    assert pathways.max_length() == long
+    assert pa.get_shortest_path(pathways) == pa.get_shortest_path(paths)
+    assert pa.get_longest_path(pathways) == pa.get_longest_path(paths)
+    assert pa.summarize_pathways(pathways) == pa.summarize_pathways(paths)
+
+
+def test_length_histogram():
+    pathways = ps.build_pathway_set(int_pathways)
+
+    assert pathways.length_histogram() == {4: 2, 5: 2}
+
+
+def test_empty():
+    pathways = ps.build_pathway_set([])
+
+    assert len(pathways) == 0
+    assert pathways.min_length() is None
+    assert pa.get_longest_path(pathways) == set()
+    assert pathways.length_histogram() == {}
+
+
+def test_build_pathway_set_duplicates():
+    paths = [(0, 1, 2), ('a', 'b'), (0, 1, 2), (0, 1), ('a', 'b')]
+
+    obs = ps.build_pathway_set(iter(paths))
+
+    assert len(obs) == 3
+    assert list(obs) == [(0, 1, 2), ('a', 'b'), (0, 1)]
+
+
+@pytest.mark.parametrize("collide", [False, True])
+def test_find_duplicate_rows(monkeypatch, collide):
+    if collide:
+        # every pathway hashes alike, so only the node comparison tells
+        # them apart
+        monkeypatch.setattr(ps, 'mix_bits', lambda values: values * 0)
+    paths = [(0, 1, 2), (0, 2, 1), (), (0, 1, 2), (3,), (0, 2, 1), (),
+             (0, 1, 3), (3,)]
+
+    obs = ps.build_pathway_set(iter(paths))
+
+    assert list(obs) == [(0, 1, 2), (0, 2, 1), (), (3,), (0, 1, 3)]
+
+
+def test_pathway_index():
+    pathways = ps.build_pathway_set(sorted(int_pathways))
+    index = ps.PathwayIndex(pathways.nodes, pathways.offsets,
+                            len(pathways.names))
+    # pathways in sorted order: (0,1,2,3,4), (0,1,5,6,4), (0,1,7,4), (0,2,3,4)
+    (one, five, seven) = (pathways.get_id(1), pathways.get_id(5),
+                          pathways.get_id(7))
+
+    assert index.get_source_rows(pathways.get_id(0)).tolist() == [0, 1, 2, 3]
+    assert index.get_sink_rows(pathways.get_id(4)).tolist() == [0, 1, 2, 3]
+    assert index.get_source_rows(one).tolist() == []
+    assert index.get_source_rows(-1).tolist() == []
+    assert index.get_all_rows([one, five]).tolist() == [1]
+    assert index.get_one_of_rows([five, seven]).tolist() == [1, 2]
+    assert index.get_all_rows([one, -1]).tolist() == []
+    assert index.get_all_rows([]).tolist() == [0, 1, 2, 3]
+    assert index.get_one_of_rows([-1]).tolist() == []
+
+
+def test_pathway_index_builds_holding_lazily():
+    pathways = ps.build_pathway_set(int_pathways)
+
+    pathways.with_source(0)
+    pathways.with_sink(4)
+
+    assert pathways.index._holding is None
+    pathways.containing_all([1])
+    assert pathways.index._holding is not None
+
+
+def test_pathway_index_containers():
+    # facility 0 is in every pathway, facility i + 1 only in pathway i
+    paths = [(0, i + 1) for i in range(200)] + [(0, 1, 2)]
+    pathways = ps.build_pathway_set(paths)
+    holding = pathways.index.holding
+    ids = [pathways.get_id(facility) for facility in [0, 1, 2]]
+
+    assert ps.is_bitmap(holding[ids[0]])
+    assert not ps.is_bitmap(holding[ids[1]])
+    assert pathways.containing_all([0, 1, 2]) == {(0, 1, 2)}
+    assert pathways.containing_all([0, 2]) == {(0, 2), (0, 1, 2)}
+    assert pathways.containing_one_of([1, 3]) == {(0, 1), (0, 3), (0, 1, 2)}
+    assert len(pathways.containing_one_of([0, 1])) == 201
+    assert len(pathways.containing_all([0])) == 201
+
+
+def test_pathway_index_shared_by_views():
+    pathways = ps.build_pathway_set(int_pathways)
+    view = pa.find_paths_containing_one_of(pathways, [2, 7])
+
+    obs = pa.find_paths_containing_all(view, [1])
+
+    assert view.index is pathways.index
+    assert obs == {(0, 1, 2, 3, 4), (0, 1, 7, 4)}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pathway_index_matches_sets(seed):
+    G = random_graph(seed, 10, 0.3)
+    paths = ap.find_simple_paths(G, [0, 1], [7, 8, 9])
+    pathways = ps.build_pathway_set(paths)
+
+    for facilities in [[2], [2, 3], [4, 5, 6]]:
+        for query in [pa.find_paths_containing_all,
+                      pa.find_paths_containing_one_of]:
+            assert query(pathways, facilities) == query(paths, facilities)
+    for facility in range(10):
+        assert (pa.find_paths_with_source(pathways, facility)
+                == pa.find_paths_with_source(paths, facility))
+        assert (pa.find_paths_with_sink(pathways, facility)
+                == pa.find_paths_with_sink(paths, facility))
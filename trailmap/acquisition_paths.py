@@ -1,34 +1,201 @@
+import time
 import networkx as nx
 from pprint import pprint
 
 
-def conduct_apa(facility_dict_in, facility_dict_out):
-    ''' '''
-    G = build_graph(facility_dict_in, facility_dict_out)
+# number of search steps between checks of the time budget
+DEADLINE_CHECK_INTERVAL = 1024
 
-    sources = list(node for node, in_deg in G.in_degree() if in_deg == 0)
-    sinks = list(node for node, out_deg in G.out_degree() if out_deg == 0)
 
-    pathways = find_simple_paths(G, sources, sinks)
+def conduct_apa(facility_dict_in, facility_dict_out, bipartite=False,
+                stream=False, cutoff=None, max_paths=None, time_budget=None,
+                stats=None):
+    '''Builds the fuel cycle graph and finds all pathways from its sources
+    to its sinks. If bipartite is True, the graph is built with
+    build_bipartite_graph. If stream is True, the pathways are returned as
+    an iterator (see iter_simple_paths) instead of a set. The search can be
+    bounded with cutoff, max_paths and time_budget (see find_simple_paths).
+    '''
+    if bipartite:
+        G = build_bipartite_graph(facility_dict_in, facility_dict_out)
+    else:
+        G = build_graph(facility_dict_in, facility_dict_out)
+
+    facilities = get_facility_nodes(G)
+    sources = list(node for node, in_deg in G.in_degree(facilities)
+                   if in_deg == 0)
+    sinks = list(node for node, out_deg in G.out_degree(facilities)
+                 if out_deg == 0)
+
+    limits = {'cutoff': cutoff, 'max_paths': max_paths,
+              'time_budget': time_budget}
+    if stream:
+        pathways = iter_simple_paths(G, sources, sinks, stats=stats, **limits)
+    else:
+        pathways = find_simple_paths(G, sources, sinks, **limits)
+        if stats is not None:
+            stats.update(pathways.stats)
 
     return G, pathways
 
 
 def build_graph(facility_dict_in, facility_dict_out):
-    '''Builds NetworkX graph from Cyclus input file
+    '''Builds NetworkX graph from Cyclus input file. Edges are found through
+    an index of the senders of each commodity, so the cost is proportional
+    to the number of facilities plus the number of edges.
     '''
     G = nx.MultiDiGraph()
     G.add_nodes_from(facility_dict_in.keys())
+    senders = build_sender_index(facility_dict_out)
     for receiver, incommods in facility_dict_in.items():
         # find all facilities with that commod as an outcommod
-        for sender, outcommods in facility_dict_out.items():
-            for commod in set(incommods).intersection(outcommods):
+        for commod in dict.fromkeys(incommods):
+            for sender in senders.get(commod, ()):
                 G.add_edge(sender, receiver, commodity=commod)
     return G
 
 
-def find_simple_paths(G, sources, sinks):
-    ''' finds all simple paths between a given list of sources and targets
+def build_sender_index(facility_dict_out):
+    '''Inverts the outcommodities of each facility into the facilities
+    that send each commodity, in input order.
+    outputs:
+        - senders: a dictionary with format {'commodity' : ['facilities']}
+    '''
+    senders = {}
+    for sender, outcommods in facility_dict_out.items():
+        for commod in outcommods:
+            senders.setdefault(commod, {})[sender] = None
+
+    return {commod: list(facilities) for commod, facilities in senders.items()}
+
+
+def build_bipartite_graph(facility_dict_in, facility_dict_out):
+    '''Builds a NetworkX graph in which commodities are nodes between the
+    facilities that trade them. A commodity with S senders and R receivers
+    adds S + R edges instead of the S x R edges of build_graph. Commodities
+    that are not both sent and received are left out, so facilities have
+    no incoming (outgoing) edges exactly when they do in build_graph.
+
+    Facility nodes have the attribute bipartite=0. Commodity nodes are
+    keyed by commodity_node(commodity) and have the attributes bipartite=1
+    and commodity=commodity.
+    '''
+    G = nx.DiGraph(bipartite=True)
+    G.add_nodes_from(facility_dict_in.keys(), bipartite=0)
+    G.add_nodes_from(facility_dict_out.keys(), bipartite=0)
+
+    senders = build_sender_index(facility_dict_out)
+    # inverting the incommodities the same way gives each commodity's
+    # receivers
+    receivers = build_sender_index(facility_dict_in)
+    for commod, commod_senders in senders.items():
+        if commod not in receivers:
+            continue
+        node = commodity_node(commod)
+        G.add_node(node, bipartite=1, commodity=commod)
+        G.add_edges_from((sender, node) for sender in commod_senders)
+        G.add_edges_from((node, receiver) for receiver in receivers[commod])
+
+    return G
+
+
+def commodity_node(commod):
+    '''Returns the node of a commodity in a bipartite graph'''
+    return ('commodity', commod)
+
+
+def is_bipartite_graph(G):
+    '''Returns whether G was built by build_bipartite_graph'''
+    return G.graph.get('bipartite', False)
+
+
+def get_facility_nodes(G):
+    '''Returns the facility nodes of G, leaving out the commodity nodes of a
+    bipartite graph.
+    '''
+    if is_bipartite_graph(G):
+        return [node for node, part in G.nodes(data='bipartite') if part == 0]
+    return list(G.nodes())
+
+
+def get_facility_successors(G, facility):
+    '''Returns the facilities that receive a commodity from facility'''
+    if is_bipartite_graph(G):
+        return list(dict.fromkeys(receiver for commod in G.successors(facility)
+                                  for receiver in G.successors(commod)))
+    return list(G.successors(facility))
+
+
+def project_facility_graph(G):
+    '''Expands a bipartite graph into the facility MultiDiGraph that
+    build_graph returns for the same input.
+    '''
+    if not is_bipartite_graph(G):
+        return G
+
+    H = nx.MultiDiGraph()
+    H.add_nodes_from(get_facility_nodes(G))
+    for node, commod in G.nodes(data='commodity'):
+        if commod is None:
+            continue
+        for sender in G.predecessors(node):
+            for receiver in G.successors(node):
+                H.add_edge(sender, receiver, commodity=commod)
+
+    return H
+
+
+def find_simple_paths(G, sources, sinks, cutoff=None, max_paths=None,
+                      time_budget=None):
+    ''' finds all simple paths between a given list of sources and targets.
+    The search stops early when one of the optional limits is hit:
+        - cutoff: only pathways with at most this many steps are found
+        - max_paths: at most this many pathways are found
+        - time_budget: the search stops after this many seconds
+    outputs:
+        - pathways: a PathwaySearchResult, i.e. a set of pathways marked as
+        truncated if a limit was hit, with statistics of the search
+    '''
+    stats = {}
+    pathways = iter_simple_paths(G, sources, sinks, cutoff=cutoff,
+                                 max_paths=max_paths, time_budget=time_budget,
+                                 stats=stats)
+
+    return PathwaySearchResult(pathways, stats)
+
+
+class PathwaySearchResult(set):
+    '''Set of pathways found by find_simple_paths. The stats attribute
+    holds the search statistics described in iter_simple_paths.
+    '''
+    def __init__(self, pathways=(), stats=None):
+        super().__init__(pathways)
+        self.stats = {} if stats is None else stats
+
+    @property
+    def truncated(self):
+        '''Whether the search stopped at a limit before finding every
+        pathway
+        '''
+        return self.stats.get('truncated', False)
+
+
+def iter_simple_paths(G, sources, sinks, cutoff=None, max_paths=None,
+                      time_budget=None, stats=None):
+    '''Lazily yields all simple paths between a given list of sources and
+    targets, in the order they are found. Every pathway is yielded exactly
+    once without keeping the pathways already found, so memory use does
+    not grow with the number of pathways. The limits are those of
+    find_simple_paths.
+
+    If a stats dictionary is given, it is kept up to date with:
+        - pathways: the number of pathways yielded
+        - sources: the number of sources to search
+        - sources_completed: the number of sources searched in full
+        - cutoff_reached, max_paths_reached, time_budget_reached: whether
+        each limit stopped part of the search
+        - truncated: whether any limit was reached
+        - elapsed: the seconds spent searching
     '''
     # turn sources/sinks into list if a single string/int was submitted
     if type(sources) == int or type(sources) == str:
@@ -36,12 +203,214 @@ def find_simple_paths(G, sources, sinks):
     if type(sinks) == int or type(sinks) == str:
         sinks = [sinks]
 
-    pathways = set()
-    for source, sink in [(x, y) for x in sources for y in sinks]:
-        pathways.update({tuple(path) for path in nx.all_simple_paths(
-            G, source=source, target=sink)})
+    sources = list(dict.fromkeys(sources))
+    if stats is None:
+        stats = {}
+    stats.update({'pathways': 0,
+                  'sources': len(sources),
+                  'sources_completed': 0,
+                  'cutoff_reached': False,
+                  'max_paths_reached': False,
+                  'time_budget_reached': False,
+                  'truncated': False,
+                  'elapsed': 0.0})
+
+    start = time.perf_counter()
+    deadline = None
+    if time_budget is not None:
+        deadline = start + time_budget
+
+    # explore each source once against the whole set of sinks, pruned by
+    # one reachability index. Pathways from different sources differ in
+    # their first node, so no pathway is found twice.
+    targets = set(sinks)
+    try:
+        index = ReachabilityIndex(G, targets)
+        for source in sources:
+            # a search from a small source never reaches a periodic check
+            # in iter_facility_paths, so check between sources as well
+            if deadline is not None and time.perf_counter() > deadline:
+                stats['time_budget_reached'] = True
+                stats['truncated'] = True
+                break
+            for path in iter_facility_paths(G, source, targets,
+                                            cutoff=cutoff, deadline=deadline,
+                                            stats=stats, index=index):
+                if max_paths is not None and stats['pathways'] >= max_paths:
+                    stats['max_paths_reached'] = True
+                    break
+                stats['pathways'] += 1
+                yield path
+            if stats['max_paths_reached'] or stats['time_budget_reached']:
+                stats['truncated'] = True
+                break
+            stats['sources_completed'] += 1
+        stats['truncated'] = (stats['truncated'] or stats['cutoff_reached'])
+    finally:
+        stats['elapsed'] = time.perf_counter() - start
+
+
+def iter_facility_paths(G, source, targets, cutoff=None, deadline=None,
+                        stats=None, index=None):
+    '''Yields every simple pathway from source to a node in targets with a
+    single depth-first search. Pathways may pass through one target on the
+    way to another, and a source that is also a target yields the pathway
+    (source,). Each pathway is yielded once.
+
+    On a bipartite graph (see build_bipartite_graph) only facilities must
+    be distinct on a path, and commodity nodes are left out of the
+    pathways.
+
+    The search never enters a facility from which no target off the current
+    path can be reached, as told by index, a ReachabilityIndex of G built
+    for the targets (or for every node). It is built if not given.
+
+    Pathways longer than cutoff steps are not followed, and the search
+    stops once time.perf_counter() passes deadline. Either event is
+    recorded in stats as cutoff_reached or time_budget_reached.
+    '''
+    for node in [source, *targets]:
+        if node not in G:
+            raise nx.NodeNotFound('source or target %s not in G' % (node,))
+
+    if index is None:
+        index = ReachabilityIndex(G, targets)
+    reach = index.reach
+    successors = get_successor_function(G)
+    if stats is None:
+        stats = {}
+    if cutoff is None:
+        cutoff = float('inf')
+
+    # live has the bits of the components holding a target that is not on
+    # the current path, and counts the number of such targets in each
+    (bits, counts) = ({}, {})
+    for target in targets:
+        bits[target] = index.get_bit(target)
+        counts[bits[target]] = counts.get(bits[target], 0) + 1
+    live = 0
+    for bit in counts:
+        live |= bit
+
+    if source in targets:
+        yield (source,)
+        counts[bits[source]] -= 1
+        if counts[bits[source]] == 0:
+            live &= ~bits[source]
+    if not reach[source] & live:
+        return
+    if cutoff < 1:
+        stats['cutoff_reached'] = True
+        return
+
+    # visited holds the current path in order. None cannot be a node, so it
+    # marks an exhausted iterator of successors.
+    visited = {source: None}
+    stack = [iter(successors(source))]
+    steps = 0
+    while stack:
+        steps += 1
+        if deadline is not None and steps % DEADLINE_CHECK_INTERVAL == 0:
+            if time.perf_counter() > deadline:
+                stats['time_budget_reached'] = True
+                return
+
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            (node, _) = visited.popitem()
+            if node in bits:
+                counts[bits[node]] += 1
+                live |= bits[node]
+            continue
+        if child in visited or not reach[child] & live:
+            continue
+        is_target = child in bits
+        if is_target:
+            yield tuple(visited) + (child,)
+            counts[bits[child]] -= 1
+            if counts[bits[child]] == 0:
+                live &= ~bits[child]
+        if reach[child] & live:
+            # the path to child has len(visited) steps, so going further
+            # would pass the cutoff
+            if len(visited) >= cutoff:
+                stats['cutoff_reached'] = True
+            else:
+                visited[child] = None
+                stack.append(iter(successors(child)))
+                continue
+        if is_target:
+            counts[bits[child]] += 1
+            live |= bits[child]
+
 
-    return pathways
+class ReachabilityIndex:
+    '''Transitive closure of G over its strongly connected components,
+    stored as integer bitsets. Every indexed component gets one bit, and
+    reach[node] holds the bits of the indexed components that node can
+    reach, including its own. Building the index is O(V + E) operations on
+    bitsets as wide as the number of indexed components.
+
+    inputs:
+        - G: a graph from build_graph or build_bipartite_graph
+        - targets: the nodes that queries may ask about reaching. If None,
+        every node is indexed, which answers any query but needs memory
+        quadratic in the number of components in the worst case
+    '''
+    def __init__(self, G, targets=None):
+        C = nx.condensation(G)
+        self.component = C.graph['mapping']
+
+        if targets is None:
+            indexed = C.nodes()
+        else:
+            for target in targets:
+                if target not in G:
+                    raise nx.NodeNotFound('target %s not in G' % (target,))
+            indexed = set(self.component[target] for target in targets)
+        self.component_bit = {c: 1 << i for i, c in enumerate(indexed)}
+
+        # components in reverse topological order, i.e. sinks first
+        component_reach = {}
+        for c in reversed(list(nx.topological_sort(C))):
+            mask = self.component_bit.get(c, 0)
+            for d in C.successors(c):
+                mask |= component_reach[d]
+            component_reach[c] = mask
+
+        self.reach = {node: component_reach[c]
+                      for node, c in self.component.items()}
+
+    def get_bit(self, node):
+        '''Returns the bit of the component of node. Raises ValueError if
+        the component is not indexed.
+        '''
+        if node not in self.component:
+            raise nx.NodeNotFound('node %s not in G' % (node,))
+        bit = self.component_bit.get(self.component[node])
+        if bit is None:
+            raise ValueError('node %s is not indexed' % (node,))
+
+        return bit
+
+    def can_reach(self, a, b):
+        '''Returns whether there is a path from a to b. Every node can
+        reach itself.
+        '''
+        if a not in self.reach:
+            raise nx.NodeNotFound('node %s not in G' % (a,))
+
+        return bool(self.reach[a] & self.get_bit(b))
+
+
+def get_successor_function(G):
+    '''Returns a function giving the facilities that receive a commodity
+    from a facility in G.
+    '''
+    if is_bipartite_graph(G):
+        return lambda facility: get_facility_successors(G, facility)
+    return G.successors
 
 
 def print_acquisition_paths(pathways): # pragma: no cover
@@ -49,3 +418,19 @@ def print_acquisition_paths(pathways): # pragma: no cover
     pprint(pathways)
 
     return
+
+
+def print_search_stats(stats): # pragma: no cover
+    '''Prints why and where a pathway search was truncated'''
+    if not stats.get('truncated'):
+        return
+
+    limits = [limit for limit in ('cutoff', 'max_paths', 'time_budget')
+              if stats[limit + '_reached']]
+    print("\nWARNING: pathway search truncated by " + ", ".join(limits))
+    print("found " + str(stats['pathways']) + " pathways from "
+          + str(stats['sources_completed']) + " of " + str(stats['sources'])
+          + " fully searched sources in "
+          + "{:.3f}".format(stats['elapsed']) + " s")
+
+    return
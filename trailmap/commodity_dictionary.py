@@ -1,28 +1,208 @@
 import os
-import sys
 import json
-import cyclus
+import hashlib
+import tempfile
+from collections.abc import Mapping
 
 
-def build_commod_dictionary(metadata_file = None): #pragma: no cover
+LIBRARY_SUFFIXES = ('.so', '.dylib', '.dll')
+
+
+def build_commod_dictionary(metadata_file = None, use_cache = True,
+                            cache_dir = None):
     '''Find all Cyclus archetypes and their commodity tags.
 
+    inputs:
+    - metadata_file: an open Cyclus metadata JSON file. If None, the metadata
+        is discovered from the Cyclus path
+    - use_cache: whether to reuse (and store) discovered metadata in the
+        on-disk cache. Ignored when a metadata_file is given
+    - cache_dir: directory of the cache. Defaults to get_cache_dir()
+
     outputs:
     - archetype_commods: a dictionary with the Cyclus archetypes available
         and the names of their incommodities and outcommodities
     '''
-    if metadata_file is None:
-        print('generating metadata')
-        metadata = cyclus.lib.discover_metadata_in_cyclus_path()
-    else: 
+    if metadata_file is not None:
         metadata = json.load(metadata_file)
+        return LazyCommodDictionary(metadata)
+
+    # cyclus is slow to import, so only import it when discovering metadata
+    import cyclus.lib
+
+    key = None
+    if use_cache:
+        if cache_dir is None:
+            cache_dir = get_cache_dir()
+        env = cyclus.lib.Env()
+        key = cache_key(cyclus_fingerprint(env.install_path, env.cyclus_path,
+                                           cyclus.lib.__file__))
+        cached = load_cached_metadata(key, cache_dir)
+        if cached is not None:
+            return cached["archetype_commods"]
 
-    archetypes = metadata["specs"]    
-    archetype_commods = build_facility_dictionary(metadata, archetypes)
+    print('generating metadata')
+    metadata = cyclus.lib.discover_metadata_in_cyclus_path()
+    archetype_commods = LazyCommodDictionary(metadata)
+
+    if key is not None:
+        # the cache entry holds every archetype, so resolve them all once
+        archetype_commods = dict(archetype_commods)
+        # the cache is best-effort, e.g. cache_dir may be read-only
+        try:
+            save_cached_metadata(key, metadata, archetype_commods, cache_dir)
+        except OSError as e:
+            print('could not cache metadata in', cache_dir + ':', e)
 
     return archetype_commods
 
 
+def get_cache_dir():
+    '''Returns the directory used to cache discovered Cyclus metadata. Uses
+    TRAILMAP_CACHE_DIR if set, otherwise the trailmap directory in
+    XDG_CACHE_HOME (~/.cache by default).
+    '''
+    cache_dir = os.environ.get('TRAILMAP_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                os.path.join(os.path.expanduser('~'),
+                                             '.cache'))
+    return os.path.join(cache_home, 'trailmap')
+
+
+def find_library_files(cyclus_path):
+    '''Finds every shared library on the Cyclus path.
+    inputs:
+    - cyclus_path: a list of directories searched by Cyclus for archetypes
+
+    outputs:
+    - libraries: a sorted list of paths to the library files
+    '''
+    libraries = set()
+    for directory in cyclus_path:
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                if name.endswith(LIBRARY_SUFFIXES):
+                    libraries.add(os.path.realpath(os.path.join(root, name)))
+
+    return sorted(libraries)
+
+
+def hash_file(path):
+    '''Returns the sha256 hex digest of a file's contents'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cyclus_fingerprint(install_path, cyclus_path, *extra_files):
+    '''Describes a Cyclus installation by its install path, CYCLUS_PATH and
+    the modification time, size and hash of every library on the Cyclus
+    path.
+    inputs:
+    - install_path: the Cyclus install prefix
+    - cyclus_path: a list of directories searched by Cyclus for archetypes
+    - extra_files: other files whose changes must invalidate the cache,
+        e.g. the Cyclus Python extension module
+
+    outputs:
+    - fingerprint: a JSON-serializable dictionary
+    '''
+    files = []
+    for path in find_library_files(cyclus_path) + sorted(extra_files):
+        stat = os.stat(path)
+        files.append([path, stat.st_mtime_ns, stat.st_size, hash_file(path)])
+
+    fingerprint = {'install_path': install_path,
+                   'cyclus_path': list(cyclus_path),
+                   'CYCLUS_PATH': os.environ.get('CYCLUS_PATH', ''),
+                   'files': files}
+
+    return fingerprint
+
+
+def cache_key(fingerprint):
+    '''Returns the content address of a Cyclus fingerprint'''
+    serialized = json.dumps(fingerprint, sort_keys=True).encode()
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def cache_file(key, cache_dir):
+    '''Returns the path of the cache entry for a given key'''
+    return os.path.join(cache_dir, 'metadata-' + key + '.json')
+
+
+def load_cached_metadata(key, cache_dir):
+    '''Reads a cache entry. Returns None if there is no valid entry for the
+    key.
+
+    outputs:
+    - entry: a dictionary with keys "metadata" and "archetype_commods"
+    '''
+    try:
+        with open(cache_file(key, cache_dir)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if entry.get("key") != key:
+        return None
+
+    # JSON stores the (incommods, outcommods) tuples as lists
+    entry["archetype_commods"] = {
+        archetype: tuple(commods)
+        for archetype, commods in entry["archetype_commods"].items()}
+
+    return entry
+
+
+def save_cached_metadata(key, metadata, archetype_commods, cache_dir):
+    '''Writes the metadata and commodity dictionary to the cache. The entry is
+    written to a temporary file first so concurrent runs never read a
+    partial entry. Entries of other keys are stale, as the key changes
+    with every rebuild of a library, so they are removed (see
+    prune_cached_metadata).
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = {'key': key,
+             'metadata': metadata,
+             'archetype_commods': archetype_commods}
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, cache_file(key, cache_dir))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    prune_cached_metadata(key, cache_dir)
+
+    return
+
+
+def prune_cached_metadata(key, cache_dir):
+    '''Removes every cache entry except the one for the given key. An entry
+    that cannot be removed, e.g. one another run removed first, is left.
+    '''
+    keep = os.path.basename(cache_file(key, cache_dir))
+    for name in os.listdir(cache_dir):
+        if (name.startswith('metadata-') and name.endswith('.json')
+                and name != keep):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    return
+
+
 def get_commod_names(metadata, uitype, agent):
     '''Return all archetypes and their aliases for a given uitype.
 
@@ -35,28 +215,134 @@ def get_commod_names(metadata, uitype, agent):
     - commods: dict with archetypes as keys and a set of acceptable aliases as
     the values
     '''
-    agent_data = metadata[agent]["vars"]
-    aliases = []
+    return index_archetype_vars(metadata[agent]["vars"]).get(uitype, [])
 
-    for var in agent_data:
-        for param in agent_data[var]:
-            if param == "uitype" and uitype in agent_data[var][param]:
-                aliases.append(var)
 
-    return aliases
+def get_uitypes(var_annotation):
+    '''Returns the uitypes of a single archetype var. A var of a container
+    type (e.g. std::vector) lists its uitype with the container's, as in
+    ["oneormore", "incommodity"]; uitypes nested deeper describe the
+    container's members and are not returned.
+    '''
+    # some vars are annotated only with a string that refers to another var
+    if not isinstance(var_annotation, dict):
+        return []
 
+    uitype = var_annotation.get("uitype")
+    if uitype is None:
+        return []
+    if isinstance(uitype, str):
+        return [uitype]
 
-def build_facility_dictionary(metadata, archetypes):
-    '''Identify commodities for each available archetype'''
-    archetype_commods = {}
+    return [member for member in uitype if isinstance(member, str)]
+
+
+def index_archetype_vars(agent_vars):
+    '''Groups the vars of one archetype by uitype.
+
+    inputs:
+    - agent_vars: the "vars" annotations of a single archetype
+
+    outputs:
+    - index: dict with uitypes as keys and a list of vars as the values, in
+    the order the vars are annotated
+    '''
+    index = {}
+    for var, annotation in agent_vars.items():
+        for uitype in get_uitypes(annotation):
+            index.setdefault(uitype, []).append(var)
+
+    return index
+
+
+def build_uitype_index(annotations, archetypes=None):
+    '''Builds an inverted index of archetype vars in a single pass over the
+    annotations.
+
+    inputs:
+    - annotations: the "annotations" of the Cyclus metadata
+    - archetypes: the archetypes to index. If None, every annotated
+    archetype is indexed
 
+    outputs:
+    - index: nested dict with format {uitype: {archetype: [vars]}}
+    '''
+    if archetypes is None:
+        archetypes = annotations.keys()
+
+    index = {}
     for archetype in archetypes:
-        incommods = get_commod_names(metadata["annotations"], "incommodity",
-                                     archetype)
-        outcommods = get_commod_names(metadata["annotations"], "outcommodity",
-                                      archetype)
+        if archetype not in annotations:
+            continue
+        agent_index = index_archetype_vars(annotations[archetype]["vars"])
+        for uitype, agent_vars in agent_index.items():
+            index.setdefault(uitype, {})[archetype] = agent_vars
 
-        archetype_commods.update({archetype: (incommods,
-                                              outcommods)})
+    return index
+
+
+def build_facility_dictionary(metadata, archetypes,
+                              uitypes=("incommodity", "outcommodity")):
+    '''Identify commodities for each available archetype. By default each
+    archetype maps to a tuple of (incommods, outcommods); other uitypes
+    (e.g. "inrecipe", "outrecipe") are read from the same index.
+    '''
+    index = build_uitype_index(metadata["annotations"], archetypes)
+
+    archetype_commods = {}
+    for archetype in archetypes:
+        archetype_commods[archetype] = tuple(
+            list(index.get(uitype, {}).get(archetype, []))
+            for uitype in uitypes)
 
     return archetype_commods
+
+
+class LazyCommodDictionary(Mapping):
+    '''Read-only dictionary of archetypes and their commodity tags that
+    resolves an archetype's tags the first time it is looked up and
+    memoizes the result. Building it is O(1); a Cyclus input only pays for
+    the archetypes it declares instead of every installed archetype.
+
+    inputs:
+    - metadata: Cyclus metadata
+    - archetypes: the available archetypes. Defaults to metadata["specs"]
+    - uitypes: the uitypes returned for each archetype, in order
+    '''
+    def __init__(self, metadata, archetypes=None,
+                 uitypes=("incommodity", "outcommodity")):
+        if archetypes is None:
+            archetypes = metadata["specs"]
+        self._annotations = metadata["annotations"]
+        self._archetypes = list(archetypes)
+        self._available = set(self._archetypes)
+        self._uitypes = tuple(uitypes)
+        self._resolved = {}
+
+    def __getitem__(self, archetype):
+        if archetype in self._resolved:
+            return self._resolved[archetype]
+        if archetype not in self._available:
+            raise KeyError(archetype)
+
+        agent_index = index_archetype_vars(
+            self._annotations[archetype]["vars"])
+        commods = tuple(list(agent_index.get(uitype, []))
+                        for uitype in self._uitypes)
+        self._resolved[archetype] = commods
+
+        return commods
+
+    def __iter__(self):
+        return iter(self._archetypes)
+
+    def __len__(self):
+        return len(self._archetypes)
+
+    def __contains__(self, archetype):
+        return archetype in self._available
+
+    @property
+    def resolved(self):
+        '''The archetypes that have been looked up so far'''
+        return list(self._resolved)
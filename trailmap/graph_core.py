@@ -0,0 +1,108 @@
+from array import array
+import networkx as nx
+import trailmap.acquisition_paths as ap
+
+
+def build_compact_graph(G):
+    '''Interns the facilities of G to the integers 0..n-1 and stores the
+    graph as compressed sparse row (CSR) arrays. Parallel edges collapse to
+    one edge labeled with every commodity they carry.
+    inputs:
+        - G: a graph from acquisition_paths.build_graph or
+        build_bipartite_graph
+    outputs:
+        - CG: a CompactGraph
+    '''
+    names = ap.get_facility_nodes(G)
+    ids = {name: i for i, name in enumerate(names)}
+    commodities = []
+    commodity_ids = {}
+
+    # {sender: {receiver: [commodity ids]}} in the order edges appear in G
+    labels = [{} for name in names]
+    for (u, v, commod) in ap.project_facility_graph(G).edges(
+            data='commodity'):
+        edge = labels[ids[u]].setdefault(ids[v], [])
+        if commod is None:
+            continue
+        if commod not in commodity_ids:
+            commodity_ids[commod] = len(commodities)
+            commodities.append(commod)
+        if commodity_ids[commod] not in edge:
+            edge.append(commodity_ids[commod])
+
+    indptr = array('q', [0])
+    indices = array('q')
+    label_ptr = array('q', [0])
+    label_ids = array('q')
+    for successors in labels:
+        for v, edge in successors.items():
+            indices.append(v)
+            label_ids.extend(edge)
+            label_ptr.append(len(label_ids))
+        indptr.append(len(indices))
+
+    return CompactGraph(names, indptr, indices, commodities, label_ptr,
+                        label_ids)
+
+
+class CompactGraph:
+    '''Facility graph with integer node ids held in flat arrays.
+
+    The successors of facility i are indices[indptr[i]:indptr[i + 1]], and
+    edge k carries the commodities
+    label_ids[label_ptr[k]:label_ptr[k + 1]], given as positions in
+    commodities. Pathways are tuples of ids; names[i] translates id i back
+    to its facility. Pathways are enumerated by
+    acquisition_paths.iter_simple_paths and translated with get_id_path.
+    Any filter of pathway_analysis works on id pathways when given ids
+    instead of names (see get_ids).
+    '''
+    def __init__(self, names, indptr, indices, commodities, label_ptr,
+                 label_ids):
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.indptr = indptr
+        self.indices = indices
+        self.commodities = commodities
+        self.label_ptr = label_ptr
+        self.label_ids = label_ids
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def get_id(self, name):
+        '''Returns the id of a facility'''
+        if name not in self.ids:
+            raise nx.NodeNotFound('node %s not in G' % (name,))
+        return self.ids[name]
+
+    def get_ids(self, names):
+        '''Returns the ids of a facility or a list of facilities'''
+        if type(names) == int or type(names) == str:
+            names = [names]
+        return [self.get_id(name) for name in names]
+
+    def get_names(self, path):
+        '''Translates a pathway of ids back to facility names'''
+        return tuple(self.names[i] for i in path)
+
+    def get_id_path(self, path):
+        '''Translates a pathway of facility names to ids'''
+        return tuple(self.get_id(name) for name in path)
+
+    def successors(self, i):
+        '''Returns the ids of the facilities that receive from facility i'''
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def get_edge_commodities(self, u, v):
+        '''Returns the commodities facility u sends to facility v'''
+        for k in range(self.indptr[u], self.indptr[u + 1]):
+            if self.indices[k] == v:
+                return [self.commodities[c] for c in
+                        self.label_ids[self.label_ptr[k]:
+                                       self.label_ptr[k + 1]]]
+        return []
@@ -1,24 +1,54 @@
 import os
-import sys
-import subprocess
 import json
+import runpy
 import xml.etree.ElementTree as ET
-import cyclus
 
 
-def parse_input(input, commodity_dictionary):
+# top-level elements of a Cyclus input file that never hold facility data
+SKIPPED_TAGS = ('recipe', 'region')
+
+# Cyclus input formats by file extension
+INPUT_FORMATS = {'.xml': 'xml', '.json': 'json', '.py': 'py'}
+
+# names Cyclus accepts for the simulation variable of a Python input file
+PY_SIMULATION_NAMES = ('simulation', 'SIMULATION', 'Simulation')
+
+
+def parse_input(input, commodity_dictionary, stream=False):
     '''Builds dicionary of facilities and their incommodies and outcommodities.
     inputs:
-        - input: a Cyclus XML input file
+        - input: a Cyclus input file in XML, JSON or Python format. The
+        format is detected from the file extension
         - commodity_dictionary: a dictionary
+        - stream: if True, parse an XML file incrementally with
+        iterparse_input to bound memory use on large inputs
     outputs:
         - facility_dictionary: a dictionary of each facility and its
         incommodities and outcommodities. format:
         {'facility' : (['incommodities'], ['outcommodities'])}
     '''
+    input_format = detect_input_format(input)
+    if input_format == 'json':
+        with open(input) as f:
+            simulation = json.load(f)
+        return parse_simulation_dict(simulation, commodity_dictionary)
+    if input_format == 'py':
+        simulation = load_py_input(input)
+        if isinstance(simulation, ET.Element):
+            return parse_root(simulation, commodity_dictionary)
+        return parse_simulation_dict(simulation, commodity_dictionary)
+
+    if stream:
+        return iterparse_input(input, commodity_dictionary)
+
     tree = ET.parse(input)
-    root = tree.getroot()
+    return parse_root(tree.getroot(), commodity_dictionary)
+
 
+def parse_root(root, commodity_dictionary):
+    '''Builds the facility dictionaries from the root of a Cyclus XML
+    input file tree.
+    '''
     input_archetypes = get_archetypes_in_input(root)
     [facility_dict_in,
      facility_dict_out] = get_facility_and_commod_names(root, input_archetypes,
@@ -43,28 +73,215 @@ def get_facility_and_commod_names(root, input_archetypes,
     '''
     facility_dict_in = {}
     facility_dict_out = {}
+    extractors = {}
 
     for facility in root.findall('./facility'):
-        facility_name = facility.find('name').text
-        facility_archetype = facility.find('config/').tag
-        facility_module = input_archetypes[facility_archetype]
+        (facility_name,
+         facility_in_commods,
+         facility_out_commods) = get_facility_commods(facility,
+                                                      input_archetypes,
+                                                      commodity_dictionary,
+                                                      extractors)
+
+        facility_dict_in[facility_name] = facility_in_commods
+        facility_dict_out[facility_name] = facility_out_commods
+
+    return facility_dict_in, facility_dict_out
+
+
+def get_facility_commods(facility, input_archetypes, commodity_dictionary,
+                         extractors=None):
+    '''Finds the name, incommodities and outcommodities of a single
+    facility.
+    inputs:
+        - facility: a <facility> element of a Cyclus input file
+        - input_archetypes: a dictionary
+        - commodity_dictionary: a dictionary
+        - extractors: a dictionary caching the commodity extractor of each
+        module, shared between calls. See build_commod_extractor
+    outputs:
+        - facility_name: a string
+        - facility_in_commods: a list of incommodities
+        - facility_out_commods: a list of outcommodities
+    '''
+    facility_name = facility.find('name').text
+    archetype_config = facility.find('config')[0]
+
+    (facility_in_commods,
+     facility_out_commods) = get_archetype_commods(
+         archetype_config.tag,
+         ((archetype_var.tag, archetype_var)
+          for archetype_var in archetype_config),
+         get_commod_values, input_archetypes, commodity_dictionary,
+         extractors)
+
+    return facility_name, facility_in_commods, facility_out_commods
+
+
+def get_archetype_commods(archetype, archetype_vars, get_values,
+                          input_archetypes, commodity_dictionary,
+                          extractors=None):
+    '''Sorts the commodities in the config of a facility into its
+    incommodities and outcommodities. Shared by the XML and the JSON
+    input formats.
+    inputs:
+        - archetype: the archetype of the facility, as named in the input
+        - archetype_vars: an iterable of (tag, value) pairs of the config
+        - get_values: a function returning the commodities of a value,
+        called only for the tags that hold commodities
+        - input_archetypes: a dictionary
+        - commodity_dictionary: a dictionary
+        - extractors: a dictionary caching the commodity extractor of each
+        module, shared between calls. See build_commod_extractor
+    outputs:
+        - facility_in_commods: a list of incommodities
+        - facility_out_commods: a list of outcommodities
+    '''
+    facility_module = input_archetypes[archetype]
 
+    if extractors is None:
+        extractors = {}
+    if facility_module not in extractors:
         (in_tags, out_tags) = commodity_dictionary[facility_module]
+        extractors[facility_module] = build_commod_extractor(in_tags,
+                                                             out_tags)
+    extractor = extractors[facility_module]
 
-        facility_in_commods = []
-        facility_out_commods = []
+    facility_in_commods = []
+    facility_out_commods = []
 
-        for archetype_var in facility.find('.config/' + facility_archetype):
-            in_commods = find_commod(archetype_var, in_tags)
-            if in_commods is not None:
-                facility_in_commods.extend(in_commods)
+    for tag, value in archetype_vars:
+        direction = extractor.get(tag)
+        if direction is None:
+            continue
 
-            out_commods = find_commod(archetype_var, out_tags)
-            if out_commods is not None:
-                facility_out_commods.extend(out_commods)
+        commods = get_values(value)
+        (is_in, is_out) = direction
+        if is_in:
+            facility_in_commods.extend(commods)
+        if is_out:
+            facility_out_commods.extend(commods)
 
-        facility_dict_in[facility_name] = facility_in_commods
-        facility_dict_out[facility_name] = facility_out_commods
+    return facility_in_commods, facility_out_commods
+
+
+def build_commod_extractor(in_tags, out_tags):
+    '''Builds a lookup table from the tags of an archetype's config to
+    the direction of the commodities they hold. Cyclus state variables
+    named with a trailing underscore (e.g. streams_) are written without it
+    in input files, so both spellings are recognized.
+    inputs:
+        - in_tags: a list of incommodity tags of an archetype
+        - out_tags: a list of outcommodity tags of an archetype
+    outputs:
+        - extractor: a dictionary with format {'tag' : (is_in, is_out)}
+    '''
+    extractor = {}
+    for tag in list(in_tags) + list(out_tags):
+        direction = (tag in in_tags, tag in out_tags)
+        extractor[tag] = direction
+        extractor.setdefault(tag.rstrip('_'), direction)
+
+    return extractor
+
+
+def get_commod_values(archetype_var):
+    '''Returns the commodities held by a single archetype var. Handles
+    single values (<commod>a</commod>), <val> lists and maps, whose <item>
+    elements hold the commodity as their <key> or, when there is no <key>,
+    as their first child.
+    inputs:
+        - archetype_var: an element of an archetype's config
+    outputs:
+        - commods: a list of commodities
+    '''
+    if len(archetype_var) == 0:
+        return [archetype_var.text]
+
+    commods = []
+    for value in archetype_var:
+        if len(value) == 0:
+            commods.append(value.text)
+        else:
+            key = value.find('key')
+            if key is None:
+                key = value[0]
+            commods.append(key.text)
+
+    return commods
+
+
+def iterparse_input(input, commodity_dictionary):
+    '''Streaming version of parse_input. Reads <archetypes> and <facility>
+    elements as the file is parsed and discards each top-level element once
+    it has been processed. The elements of recipe and region subtrees are
+    cleared and detached from their parents as they end, so memory use is
+    bounded by the largest other top-level element, usually a facility,
+    rather than the size of the file.
+    inputs:
+        - input: a Cyclus XML input file
+        - commodity_dictionary: a dictionary
+    outputs:
+        - facility_dictionary: a dictionary of each facility and its
+        incommodities and outcommodities. format:
+        {'facility' : (['incommodities'], ['outcommodities'])}
+    '''
+    facility_dict_in = {}
+    facility_dict_out = {}
+
+    input_archetypes = None
+    # facilities that appear before the <archetypes> element
+    pending = []
+    extractors = {}
+
+    root = None
+    # the open elements, from the root down
+    parents = []
+    skipping = False
+    for event, elem in ET.iterparse(input, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            if len(parents) == 1:
+                root = elem
+            elif len(parents) == 2 and elem.tag in SKIPPED_TAGS:
+                skipping = True
+            continue
+
+        parents.pop()
+        depth = len(parents)
+        if depth > 1:
+            if skipping:
+                # elem is the last child left, so removing it is cheap
+                elem.clear()
+                parents[-1].remove(elem)
+            continue
+        if depth == 0:
+            break
+
+        # a top-level element is complete
+        if elem.tag == 'archetypes':
+            if input_archetypes is None:
+                input_archetypes = {}
+            input_archetypes.update(read_archetype_specs(elem))
+        elif elem.tag == 'facility':
+            pending.append(elem)
+
+        if input_archetypes is not None:
+            for facility in pending:
+                (facility_name,
+                 facility_in_commods,
+                 facility_out_commods) = get_facility_commods(
+                     facility, input_archetypes, commodity_dictionary,
+                     extractors)
+                facility_dict_in[facility_name] = facility_in_commods
+                facility_dict_out[facility_name] = facility_out_commods
+            pending = []
+
+        skipping = False
+        root.clear()
+
+    if pending:
+        raise ValueError('Cyclus input file has no <archetypes> element')
 
     return facility_dict_in, facility_dict_out
 
@@ -78,18 +295,41 @@ def get_archetypes_in_input(root):
                                {'archetype' : 'module::archetype'}
     '''
     archetypes_in_input = {}
-    for archetype in root.findall('./archetypes/'):
-        for library in archetype.findall('./lib'):
-            lib = library.text
-        for archetypename in archetype.findall('./name'):
-            name = archetypename.text
+    for archetypes in root.findall('./archetypes'):
+        archetypes_in_input.update(read_archetype_specs(archetypes))
 
-        library_and_archetype = (':%s:%s' % (lib, name))
-        archetypes_in_input[name] = library_and_archetype
+    return archetypes_in_input
+
+
+def read_archetype_specs(archetypes):
+    '''Reads the specs of a single <archetypes> element.
+    inputs:
+        - archetypes: an <archetypes> element of a Cyclus input file
+    outputs:
+        - archetypes_in_input: a dictionary with format
+                               {'archetype' : 'module::archetype'}
+    '''
+    archetypes_in_input = {}
+    for archetype in archetypes:
+        name = archetype.findtext('name')
+        archetypes_in_input[name] = format_archetype_spec(
+            archetype.findtext('lib'), name)
 
     return archetypes_in_input
 
 
+def format_archetype_spec(lib, name):
+    '''Returns the ':lib:name' spec of an archetype. As in Cyclus, an
+    archetype without a lib is looked up in the library of its own name.
+    '''
+    if name is None:
+        raise ValueError('Cyclus archetype spec has no name')
+    if not lib:
+        lib = name
+
+    return ':%s:%s' % (lib, name)
+
+
 def find_commod(archetype_tag, commod_tags):
     '''Searches for commodities within an acceptable list of commodity tags.
     Returns None if none found
@@ -100,15 +340,127 @@ def find_commod(archetype_tag, commod_tags):
     outputs:
         - commods: a single commodity as a string or a list of commodities
     '''
-    commod_list = []
-
     if archetype_tag.tag in commod_tags:
-        vals = archetype_tag.findall('./')
-        if vals:
-            for commod in vals:
-                commod_list.append(commod.text)
+        return get_commod_values(archetype_tag)
+
+    return []
+
+
+def detect_input_format(input):
+    '''Returns the format of a Cyclus input file, 'xml', 'json' or 'py',
+    from its extension. Files with other extensions are read as XML.
+    inputs:
+        - input: a path or an open file
+    '''
+    name = getattr(input, 'name', input)
+    if not isinstance(name, (str, os.PathLike)):
+        return 'xml'
+
+    extension = os.path.splitext(os.fspath(name))[1].lower()
+    return INPUT_FORMATS.get(extension, 'xml')
+
+
+def load_py_input(input):
+    '''Runs a Cyclus Python input file and returns its simulation. As in
+    Cyclus, the file defines the simulation in a top-level variable, as a
+    dictionary or as a JSON or XML string.
+    outputs:
+        - simulation: a dictionary, or the root of an XML tree
+    '''
+    namespace = runpy.run_path(input)
+    for name in PY_SIMULATION_NAMES:
+        if name in namespace:
+            simulation = namespace[name]
+            break
+    else:
+        raise ValueError('Python input file does not define a simulation')
+
+    if isinstance(simulation, str):
+        simulation = simulation.strip()
+        if simulation.startswith('<'):
+            return ET.fromstring(simulation)
+        return json.loads(simulation)
+
+    return simulation
+
+
+def parse_simulation_dict(simulation, commodity_dictionary):
+    '''Builds the facility dictionaries from a Cyclus simulation in its JSON
+    structure, as read from a JSON or Python input file.
+    inputs:
+        - simulation: a dictionary, with or without the outer
+        {'simulation': ...} key
+        - commodity_dictionary: a dictionary
+    outputs:
+        - facility_dictionary: a dictionary of each facility and its
+        incommodities and outcommodities. format:
+        {'facility' : (['incommodities'], ['outcommodities'])}
+    '''
+    if 'simulation' in simulation:
+        simulation = simulation['simulation']
+
+    input_archetypes = get_archetypes_in_dict(simulation)
+
+    facility_dict_in = {}
+    facility_dict_out = {}
+    extractors = {}
+
+    for facility in as_list(simulation.get('facility', [])):
+        facility_name = facility['name']
+        ((archetype, archetype_config),) = facility['config'].items()
+
+        (facility_in_commods,
+         facility_out_commods) = get_archetype_commods(
+             archetype, (archetype_config or {}).items(),
+             get_commod_values_in_dict, input_archetypes,
+             commodity_dictionary, extractors)
+
+        facility_dict_in[facility_name] = facility_in_commods
+        facility_dict_out[facility_name] = facility_out_commods
+
+    return facility_dict_in, facility_dict_out
+
+
+def get_archetypes_in_dict(simulation):
+    '''Finds the modules and archetypes that are defined in the archetypes
+    of a simulation in its JSON structure.
+    outputs:
+        - archetypes_in_input: a dictionary with format
+                               {'archetype' : 'module::archetype'}
+    '''
+    archetypes_in_input = {}
+    for spec in as_list(simulation['archetypes']['spec']):
+        name = spec.get('name')
+        archetypes_in_input[name] = format_archetype_spec(spec.get('lib'),
+                                                          name)
+
+    return archetypes_in_input
+
+
+def get_commod_values_in_dict(value):
+    '''JSON counterpart of get_commod_values. Handles single values,
+    {'val': [...]} lists and {'item': [...]} maps.
+    '''
+    if not isinstance(value, dict):
+        return [str(v) for v in as_list(value)]
+
+    if 'val' in value:
+        return [str(v) for v in as_list(value['val'])]
+
+    commods = []
+    for item in as_list(value.get('item', [])):
+        if 'key' in item:
+            commods.append(str(item['key']))
         else:
-            commod_list.append(archetype_tag.text)
-        return commod_list
+            commods.append(str(next(iter(item.values()))))
 
-    return commod_list
+    return commods
+
+
+def as_list(value):
+    '''The JSON form of a Cyclus input writes a repeated element as a list,
+    but a single element as the element itself.
+    '''
+    if isinstance(value, list):
+        return value
+    return [value]
@@ -1,26 +1,33 @@
+import sys
+import heapq
+import multiprocessing
 import networkx as nx
-import matplotlib.pyplot as plt
-import numpy as np
 from more_itertools import pairwise
 from collections import Counter
+from collections.abc import Collection
+from math import inf
+import trailmap.acquisition_paths as ap
 
 
 def print_graph_parameters(G, pathways): # pragma: no cover
-    '''Prints a set of parameters characterizing the graph
+    '''Prints a set of parameters characterizing the graph. The parameters
+    of a bipartite graph are those of its facility graph, so they match the
+    default graph of the same input.
     '''
+    G = ap.project_facility_graph(G)
     print('\nGRAPH PARAMETERS')
 
-    num_paths = len(pathways)
+    (num_paths, shortest, longest) = summarize_pathways(pathways)
     print("A total of " + str(num_paths) + " pathways were generated")
 
-    shortest = get_shortest_path(pathways)
-    longest = get_longest_path(pathways)
+    # a bounded search may stop before it finds any pathway
+    if num_paths > 0:
+        print("\nThe shortest pathway is length "
+              + str(len(next(iter(shortest)))))
+        print("pathways with this length are " + str(shortest))
 
-    print("\nThe shortest pathway is length " + str(len(next(iter(shortest)))))
-    print("pathways with this length are " + str(shortest))
-
-    print("\nGraph depth is " + str(len(next(iter(longest)))))
-    print("pathways with this length are " + str(longest))
+        print("\nGraph depth is " + str(len(next(iter(longest)))))
+        print("pathways with this length are " + str(longest))
 
     semiconnected = nx.is_semiconnected(G)
     print('\nIs the graph semiconnected? ' + str(semiconnected))
@@ -38,6 +45,7 @@ def find_node_disjoint_paths(G, s, t):
     '''Returns a set of paths that share a source and target node, but have
     exactly 0 shared edges.
     '''
+    G = project_bipartite_graph(G)
     ndp = set()
     if s in G and t in G:
         paths = list(nx.node_disjoint_paths(G, s, t))
@@ -48,6 +56,18 @@ def find_node_disjoint_paths(G, s, t):
     return ndp
 
 
+def project_bipartite_graph(G):
+    '''Returns the facility DiGraph of a graph from
+    acquisition_paths.build_bipartite_graph, so that queries never see its
+    commodity nodes. The edges between two facilities merge into one whose
+    'commodity' lists the commodities they trade (see
+    reduce_multidigraph). Any other graph is returned as is.
+    '''
+    if ap.is_bipartite_graph(G):
+        return reduce_multidigraph(ap.project_facility_graph(G))[0]
+    return G
+
+
 def is_multidigraph(G):
     return (G.is_directed() and G.is_multigraph())
 
@@ -55,20 +75,67 @@ def is_multidigraph(G):
 def has_multiedges(G):
     '''Determines if graph G contains multiple edges between any pair of
     nodes. Returns True, False, or None if the provided graph != a
-    NetworkX Multigraph.
+    NetworkX Multigraph. Scans the adjacency once, without copies.
     '''
     if is_multidigraph(G):
-        H = nx.DiGraph(G)
-        return (sorted(H.edges()) != sorted(G.edges()))
+        return any(len(keys) > 1 for neighbors in G.adj.values()
+                   for keys in neighbors.values())
     else:
         return None
 
 
+def reduce_multidigraph(G):
+    '''Merges the parallel edges of MultiDiGraph G into a DiGraph in a
+    single pass without losing what they carried. The capacities of
+    parallel edges are summed; an edge without 'capacity' has infinite
+    capacity, so a merged edge with such a member gets no 'capacity'
+    either. The 'commodity' of each parallel edge is kept in a list, and
+    other attributes are taken from the last parallel edge, as
+    nx.DiGraph(G) does. A DiGraph is returned as is, so a graph reduced
+    once can be passed to every aggregate=True query without another copy.
+    outputs:
+        - H: a DiGraph
+        - multiedges: a dictionary with format {(u, v) : number of edges}
+        for the node pairs joined by more than one edge
+    '''
+    if type(G) == nx.classes.digraph.DiGraph:
+        return G, {}
+    if not is_multidigraph(G):
+        raise TypeError('Graph must be MultiDiGraph or DiGraph type.')
+
+    H = nx.DiGraph()
+    H.graph.update(G.graph)
+    H.add_nodes_from(G.nodes(data=True))
+    multiedges = {}
+    for u, neighbors in G.adj.items():
+        for v, keys in neighbors.items():
+            data = {}
+            capacity = 0
+            commodities = []
+            for attributes in keys.values():
+                data.update(attributes)
+                capacity += attributes.get('capacity', inf)
+                if 'commodity' in attributes:
+                    commodities.append(attributes['commodity'])
+            data.pop('capacity', None)
+            if capacity != inf:
+                data['capacity'] = capacity
+            data['commodity'] = commodities
+            H.add_edge(u, v, **data)
+            if len(keys) > 1:
+                multiedges[(u, v)] = len(keys)
+
+    return H, multiedges
+
+
 def transform_to_digraph(G):
     '''Reduces multigraph to digraph and returns whether the transform is
     safe/does not lose edges (True), or if the the transform is unsafe
-    and information is lost (False)
+    and information is lost (False). A bipartite graph is projected onto
+    its facilities without loss (see project_bipartite_graph).
     '''
+    if ap.is_bipartite_graph(G):
+        return project_bipartite_graph(G), True
     if is_multidigraph(G):
         if has_multiedges(G) is False:
             safe = True
@@ -82,13 +149,21 @@ def transform_to_digraph(G):
         return None, False
 
 
-def find_maximum_flow(H, s, t):
+def find_maximum_flow(H, s, t, aggregate=False):
     '''Finds maximum flow between a source and target node in DiGraph G.
-    Requires edge attribute 'capacity'. MultiDiGraphs not supported.
-    '''    
+    Requires edge attribute 'capacity'. MultiDiGraphs are only supported
+    with aggregate=True, which merges their parallel edges with
+    reduce_multidigraph first. That copies the graph on every call, so
+    for many queries reduce it once and pass the DiGraph instead. A
+    bipartite graph is projected onto its facilities (see
+    project_bipartite_graph).
+    '''
+    H = project_bipartite_graph(H)
+    if aggregate:
+        (H, multiedges) = reduce_multidigraph(H)
     if type(H) == nx.classes.digraph.DiGraph:
         max_flow_path = nx.maximum_flow(H, s, t)
-        max_flow = nx.maximum_flow_value(H, s, t)
+        max_flow = max_flow_path[0]
         return max_flow_path, max_flow
     else:
         raise TypeError('Graph must be DiGraph type. Use \
@@ -96,11 +171,164 @@ def find_maximum_flow(H, s, t):
             which may result in loss of information')
 
 
-def find_pathway_flow(H, pathway):
+def find_aggregate_flow(H, sources, sinks):
+    '''Finds the maximum flow from all sources to all sinks of DiGraph H
+    with a single solve, through a virtual super-source feeding every
+    source and a virtual super-sink fed by every sink. A facility that is
+    both a source and a sink, such as an isolated facility, is only used
+    as a source, as find_flow_matrix leaves out a node paired with itself.
+    Requires edge attribute 'capacity'. MultiDiGraphs not supported. A
+    bipartite graph is projected onto its facilities (see
+    project_bipartite_graph).
+    outputs:
+        - flow_value: the total flow, or inf if a source reaches a sink
+        along edges of infinite capacity only, as in find_flow_matrix
+        - flow_dict: the flow on each edge of H, with format
+        {u : {v : flow}}, or None if flow_value is inf
+        - decomposition: a list of (pathway, flow) pairs from a source to
+        a sink that add up to flow_value (see decompose_flow), or None if
+        flow_value is inf
+    '''
+    H = project_bipartite_graph(H)
+    check_flow_graph(H)
+    sources = list(dict.fromkeys(sources))
+    sinks = [sink for sink in dict.fromkeys(sinks) if sink not in sources]
+    (super_source, super_sink) = (object(), object())
+    F = H.copy()
+    # edges without capacity are infinite
+    F.add_edges_from((super_source, source) for source in sources)
+    F.add_edges_from((sink, super_sink) for sink in sinks)
+
+    try:
+        (flow_value, flow_dict) = nx.maximum_flow(F, super_source,
+                                                  super_sink)
+    except nx.NetworkXUnbounded:
+        return inf, None, None
+
+    decomposition = [(path[1:-1], flow) for path, flow in
+                     decompose_flow(flow_dict, super_source, super_sink)]
+    del flow_dict[super_source]
+    del flow_dict[super_sink]
+    for sink in sinks:
+        del flow_dict[sink][super_sink]
+
+    return flow_value, flow_dict, decomposition
+
+
+def decompose_flow(flow_dict, s, t):
+    '''Splits an s-t flow into flows along pathways. Follows edges that
+    carry flow from s until t is reached, then subtracts the smallest flow
+    on the way. Flow around a cycle is cancelled when the walk closes it.
+    flow_dict is not modified.
+    outputs:
+        - decomposition: a list of (pathway, flow) pairs
+    '''
+    residual = {u: {v: flow for v, flow in flows.items() if flow > 0}
+                for u, flows in flow_dict.items()}
+    decomposition = []
+    while residual.get(s):
+        # visited holds the walk in order, with the position of each node
+        visited = {s: 0}
+        node = s
+        while node != t:
+            if not residual.get(node):
+                # only rounding errors of float capacities are left
+                return decomposition
+            node = next(iter(residual[node]))
+            if node in visited:
+                cycle = list(visited)[visited[node]:] + [node]
+                subtract_flow(residual, cycle)
+                for cycle_node in cycle[1:-1]:
+                    del visited[cycle_node]
+                continue
+            visited[node] = len(visited)
+        path = list(visited)
+        flow = subtract_flow(residual, path)
+        decomposition.append((tuple(path), flow))
+
+    return decomposition
+
+
+def subtract_flow(residual, path):
+    '''Subtracts the smallest flow along path from each of its edges and
+    returns it
+    '''
+    flow = min(residual[u][v] for u, v in pairwise(path))
+    for u, v in pairwise(path):
+        residual[u][v] -= flow
+        if residual[u][v] <= 0:
+            del residual[u][v]
+
+    return flow
+
+
+def find_flow_matrix(H, sources, sinks, processes=None):
+    '''Finds the maximum flow between every source and every sink of
+    DiGraph H. The sources are split across a pool of worker processes,
+    each solving all the sinks of one source; processes=1 solves them in
+    this process. A pair joined by a path of infinite capacity gets
+    infinite flow. Requires edge attribute 'capacity'. MultiDiGraphs not
+    supported. A bipartite graph is projected onto its facilities (see
+    project_bipartite_graph).
+    outputs:
+        - flows: a dictionary with format {(source, sink) : flow}. Pairs
+        of a node with itself are left out.
+    '''
+    H = project_bipartite_graph(H)
+    check_flow_graph(H)
+    tasks = [(H, source, sinks) for source in dict.fromkeys(sources)]
+    if processes == 1 or len(tasks) <= 1:
+        results = map(find_source_flows, tasks)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(find_source_flows, tasks)
+
+    flows = {}
+    for result in results:
+        flows.update(result)
+
+    return flows
+
+
+def find_source_flows(task):
+    '''Finds the maximum flow from one source to each sink. Takes a single
+    (H, source, sinks) tuple so it can run in a worker process.
+    '''
+    (H, source, sinks) = task
+    flows = {}
+    for sink in sinks:
+        if sink == source:
+            continue
+        try:
+            flows[(source, sink)] = nx.maximum_flow_value(H, source, sink)
+        except nx.NetworkXUnbounded:
+            flows[(source, sink)] = inf
+
+    return flows
+
+
+def check_flow_graph(H):
+    '''Raises TypeError unless H is a DiGraph'''
+    if type(H) == nx.classes.multidigraph.MultiDiGraph:
+        raise TypeError('Graph must be DiGraph type. Use \
+            convert_to_digraph to help convert a MultiDiGraph to a DiGraph, \
+            which may result in loss of information')
+    elif type(H) != nx.classes.digraph.DiGraph:
+        raise TypeError('Graph must be DiGraph type.')
+
+
+def find_pathway_flow(H, pathway, aggregate=False):
     '''returns the maximum permissible flow for a given pathway in DiGraph G. 
     Any edge without 'capacity' attribute will be given infinite capacity.
-    MultiDiGraphs not supported.
+    MultiDiGraphs are only supported with aggregate=True, which merges
+    their parallel edges with reduce_multidigraph first. That copies the
+    graph on every call, so for many pathways reduce it once and pass the
+    DiGraph, or use find_pathway_flows. A bipartite graph is projected
+    onto its facilities (see project_bipartite_graph).
     '''
+    H = project_bipartite_graph(H)
+    if aggregate:
+        (H, multiedges) = reduce_multidigraph(H)
     if type(H) == nx.classes.digraph.DiGraph:
         edges = set(pairwise(pathway))
         H_sg = H.edge_subgraph(edges).copy()
@@ -120,13 +348,91 @@ def find_pathway_flow(H, pathway):
         raise TypeError('Graph must be DiGraph type.')
 
 
-def find_simple_cycles(G): # pragma: no cover
+def find_pathway_flows(H, pathways, aggregate=False):
+    '''Finds the bottleneck of every pathway in DiGraph H in a single pass.
+    The maximum flow along a simple pathway is the smallest capacity of its
+    edges, so no flow problem is solved and no subgraph is copied. Edge
+    capacities are looked up once and shared across pathways. Any edge
+    without 'capacity' attribute will be given infinite capacity. Unlike
+    find_pathway_flow, a pathway of only infinite capacities is not an
+    error: it gets infinite flow and no bottleneck edge.
+    MultiDiGraphs are only supported with aggregate=True, which merges
+    their parallel edges with reduce_multidigraph once for all pathways.
+    A bipartite graph is projected onto its facilities (see
+    project_bipartite_graph).
+    outputs:
+        - flows: a dictionary with format {path : (capacity, edge)}, where
+        edge is the first edge of the pathway with the smallest capacity,
+        or None. A stream of pathways gives a stream of
+        (path, (capacity, edge)) pairs instead.
+    '''
+    H = project_bipartite_graph(H)
+    if aggregate:
+        (H, multiedges) = reduce_multidigraph(H)
+    check_flow_graph(H)
+    capacities = {}
+
+    def get_capacity(edge):
+        if edge not in capacities:
+            (u, v) = edge
+            if not H.has_edge(u, v):
+                raise nx.NetworkXError('edge %s not in H' % (edge,))
+            capacities[edge] = H.edges[u, v].get('capacity', inf)
+        return capacities[edge]
+
+    def find_bottleneck(path):
+        bottleneck = (inf, None)
+        for edge in pairwise(path):
+            capacity = get_capacity(edge)
+            if capacity < bottleneck[0]:
+                bottleneck = (capacity, edge)
+        return bottleneck
+
+    if is_pathway_stream(pathways):
+        return ((path, find_bottleneck(path)) for path in pathways)
+
+    return {path: find_bottleneck(path) for path in pathways}
+
+
+def find_simple_cycles(G, length_bound=None, max_cycles=None):
     '''finds cycles in a graph and returns them in a list of lists.
+    Every cycle lies within one strongly connected component, so each
+    component with a cycle is searched on its own. Only cycles of at most
+    length_bound nodes are found, and the search stops after max_cycles
+    cycles. The cycles of a bipartite graph are those of its facilities
+    (see project_bipartite_graph).
     '''
-    sc = list(nx.simple_cycles(G))
+    G = project_bipartite_graph(G)
+    sc = []
+    if max_cycles is not None and max_cycles <= 0:
+        return sc
+    for component in nx.strongly_connected_components(G):
+        if len(component) == 1:
+            node = next(iter(component))
+            if not G.has_edge(node, node):
+                continue
+        for cycle in nx.simple_cycles(G.subgraph(component),
+                                      length_bound=length_bound):
+            sc.append(cycle)
+            if max_cycles is not None and len(sc) >= max_cycles:
+                return sc
     return sc
 
 
+def build_cycle_index(sc):
+    '''Indexes a list of cycles by the nodes they pass through.
+    outputs:
+        - index: a dictionary with format {node : [(k, i)]}, where node is
+        at position i of cycle sc[k]
+    '''
+    index = {}
+    for k, cycle in enumerate(sc):
+        for i, node in enumerate(cycle):
+            index.setdefault(node, []).append((k, i))
+
+    return index
+
+
 def check_if_sublist(path, list_of_steps):
     '''Checks to see if a pathway contains each element in steps (list)
     in order. Returns the position where the steps begin. If False, returns
@@ -149,6 +455,87 @@ def check_if_sublist(path, list_of_steps):
     return pos
 
 
+def match_signatures(pathways, signatures):
+    '''Checks every pathway against a library of step sequences (e.g.
+    diversion signatures) in a single pass over the pathways. Gives the
+    same positions as check_if_sublist(path, signature), but each pathway is
+    scanned once for all signatures (see SignatureMatcher).
+    inputs:
+        - pathways: a collection or a stream of pathways
+        - signatures: a list of step sequences
+    outputs:
+        - matches: a dictionary with format {path : positions}, where
+        positions[k] is the position where signatures[k] begins in path, or
+        -1. A stream of pathways gives a stream of (path, positions) pairs
+        instead.
+    '''
+    matcher = SignatureMatcher(signatures)
+    if is_pathway_stream(pathways):
+        return ((path, matcher.match(path)) for path in pathways)
+
+    return {path: matcher.match(path) for path in pathways}
+
+
+class SignatureMatcher:
+    '''Aho-Corasick automaton over a list of step sequences. Matching a
+    pathway takes O(len(path) + number of matches), however many signatures
+    there are. Every state is a node of the trie of the signatures, with a
+    dictionary of transitions, a failure link to the state of its longest
+    proper suffix in the trie, and the signatures that end there.
+    '''
+    def __init__(self, signatures):
+        self.signatures = [tuple(signature) for signature in signatures]
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for k, signature in enumerate(self.signatures):
+            if not signature:
+                continue
+            state = 0
+            for step in signature:
+                if step not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.outputs.append([])
+                    self.transitions[state][step] = len(self.transitions) - 1
+                state = self.transitions[state][step]
+            self.outputs[state].append(k)
+
+        # breadth-first, so the failure link of a state's parent is known
+        self.failures = [0] * len(self.transitions)
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            for step, child in self.transitions[state].items():
+                failure = self.failures[state]
+                while failure and step not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                failure = self.transitions[failure].get(step, 0)
+                if failure == child:
+                    failure = 0
+                self.failures[child] = failure
+                self.outputs[child] = (self.outputs[child]
+                                       + self.outputs[failure])
+                queue.append(child)
+
+    def match(self, path):
+        '''Returns, for each signature, the position where it first begins
+        in path, or -1
+        '''
+        positions = [-1] * len(self.signatures)
+        remaining = sum(1 for signature in self.signatures if signature)
+        state = 0
+        for i, step in enumerate(path):
+            while state and step not in self.transitions[state]:
+                state = self.failures[state]
+            state = self.transitions[state].get(step, 0)
+            for k in self.outputs[state]:
+                if positions[k] == -1:
+                    positions[k] = i - len(self.signatures[k]) + 1
+                    remaining -= 1
+            if remaining == 0:
+                break
+
+        return tuple(positions)
+
+
 def roll_cycle(path, cycle):
     '''Checks if a cycle can be entered from a node in a simple path. If so,
     finds the last overlapping node and rolls the cycle so it begins with that
@@ -158,7 +545,8 @@ def roll_cycle(path, cycle):
     # find the shared node that appears last in the path
     for node in path[-1:0:-1]:
         if node in cycle:
-            rolled = tuple(np.roll(cycle, -cycle.index(node)),)
+            i = cycle.index(node)
+            rolled = tuple(cycle[i:]) + tuple(cycle[:i])
             break
 
     return rolled
@@ -176,63 +564,190 @@ def insert_cycles(pathway, rolled_cycles):
 
 def get_pathways_with_cycles(pathways, sc):
     '''For the given list of pathways and simple cycles, returns a set of
-    pathways that could contain 1 or more cycles
+    pathways that could contain 1 or more cycles. Each pathway only looks
+    up the cycles through its own nodes, in an index built once.
     '''
     if len(pathways) == 0:
         return set()
 
+    index = build_cycle_index(sc)
     pathways_with_cycles = set()
     for path in pathways:
-        rolled_cycles = set()
-        for cycle in sc:
-            rolled_cycle = roll_cycle(path, cycle)
-            if rolled_cycle:
-                rolled_cycles.add(rolled_cycle)
-        
-        # record all the pathways that have cycles, insert single cycle
+        rolled_cycles = get_rolled_cycles(path, sc, index)
+
+        # record all the pathways that have cycles, insert single cycle.
+        # Cycles entered from the same node are inserted longest first.
         if rolled_cycles:
             pathways_with_cycles.add(insert_cycles(path, rolled_cycles))
 
     return pathways_with_cycles
 
 
+def iter_pathways_with_cycles(pathways, sc, max_cycles=None,
+                              max_variants=None):
+    '''Lazily yields every way of inserting one or more of the cycles
+    that can be entered from each pathway (see get_rolled_cycles), without
+    building the power set of the cycles. Variants come in order of the
+    number of inserted cycles, then of total length, then of the order of
+    the pathways. A pathway with all its cycles inserted is the variant
+    get_pathways_with_cycles returns for it.
+    inputs:
+        - pathways: a collection or a stream of pathways. A stream is read
+        in full before the first variant is yielded
+        - sc: a list of simple cycles
+        - max_cycles: only variants with at most this many cycles are
+        yielded
+        - max_variants: at most this many variants are yielded
+    '''
+    index = build_cycle_index(sc)
+    # the cycles of each pathway, as (length, position) shortest first
+    entries = []
+    for path in pathways:
+        rolled_cycles = get_rolled_cycles(path, sc, index)
+        if rolled_cycles:
+            lengths = sorted((len(rolled), i)
+                             for i, rolled in enumerate(rolled_cycles))
+            entries.append((path, rolled_cycles, lengths))
+
+    most_cycles = max((len(entry[1]) for entry in entries), default=0)
+    if max_cycles is not None:
+        most_cycles = min(most_cycles, max_cycles)
+
+    yielded = 0
+    for k in range(1, most_cycles + 1):
+        # best-first search over the k-subsets of every pathway's cycles,
+        # each subset given by sorted positions in its lengths list
+        heap = []
+        for p, (path, rolled_cycles, lengths) in enumerate(entries):
+            if len(lengths) >= k:
+                push_cycle_subset(heap, entries, p, tuple(range(k)), k - 1)
+
+        while heap:
+            (_, length, p, subset, last) = heapq.heappop(heap)
+            if max_variants is not None and yielded >= max_variants:
+                return
+            (path, rolled_cycles, lengths) = entries[p]
+            positions = sorted(lengths[j][1] for j in subset)
+            yielded += 1
+            yield insert_cycles(path, [rolled_cycles[i] for i in positions])
+
+            # moving one cycle to the next longer one never decreases the
+            # length. Only the last moved cycle or an earlier one may move,
+            # so every subset comes from exactly one parent: the last cycle
+            # moves to its place first, then the one before it, and so on
+            for j in range(last + 1):
+                moved = subset[j] + 1
+                if moved < len(lengths) and (j == k - 1
+                                             or moved < subset[j + 1]):
+                    push_cycle_subset(heap, entries, p,
+                                      subset[:j] + (moved,) + subset[j + 1:],
+                                      j)
+
+
+def push_cycle_subset(heap, entries, p, subset, last):
+    '''Pushes a subset of the cycles of entries[p] onto the heap of
+    iter_pathways_with_cycles, along with the position of the last moved
+    cycle
+    '''
+    (path, rolled_cycles, lengths) = entries[p]
+    length = len(path) + sum(lengths[j][0] for j in subset)
+    heapq.heappush(heap, (len(subset), length, p, subset, last))
+
+
+def get_rolled_cycles(path, sc, index):
+    '''Rolls every cycle of sc that can be entered from path, as
+    roll_cycle does, using an index from build_cycle_index.
+    outputs:
+        - rolled_cycles: a list of distinct rolled cycles, longest first,
+        then in the order of sc
+    '''
+    entered = set()
+    rolled_cycles = {}
+    # the shared node that appears last in the path rolls each cycle
+    for node in path[-1:0:-1]:
+        for k, i in index.get(node, ()):
+            if k in entered:
+                continue
+            entered.add(k)
+            rolled = tuple(sc[k][i:]) + tuple(sc[k][:i])
+            rolled_cycles.setdefault(rolled, k)
+
+    return sorted(rolled_cycles,
+                  key=lambda rolled: (-len(rolled), rolled_cycles[rolled]))
+
+
+def is_pathway_stream(pathways):
+    '''Returns whether pathways is a one-pass iterator, such as the one
+    returned by acquisition_paths.iter_simple_paths, rather than a
+    collection like a set.
+    '''
+    return not isinstance(pathways, Collection)
+
+
+def is_pathway_set(pathways):
+    '''Returns whether pathways is a pathway_set.PathwaySet. Such a set can
+    only exist once its module is imported, so numpy is never imported
+    here.
+    '''
+    pathway_set = sys.modules.get('trailmap.pathway_set')
+    return (pathway_set is not None
+            and isinstance(pathways, pathway_set.PathwaySet))
+
+
+def select_pathways(pathways, keep):
+    '''Returns the pathways for which keep(path) is True. A stream of
+    pathways is filtered lazily into a new stream, a PathwaySet into a view
+    of it, and any other collection of pathways into a set.
+    '''
+    if is_pathway_set(pathways):
+        return pathways.select_where(keep)
+    if is_pathway_stream(pathways):
+        return (path for path in pathways if keep(path))
+
+    return set(path for path in pathways if keep(path))
+
+
+def no_pathways(pathways):
+    '''Returns an empty result of the same kind select_pathways returns'''
+    if is_pathway_set(pathways):
+        return pathways.empty()
+    if is_pathway_stream(pathways):
+        return iter(())
+
+    return set()
+
+
 def find_paths_with_source(pathways, source):
     '''returns a subset of pathways that contain a given facility as the source
     '''
-    if len(pathways) == 0:
-        return set()
-
-    subset_pathways = set([ path for path in pathways if path[0] == source])
-    return subset_pathways
+    if is_pathway_set(pathways):
+        return pathways.with_source(source)
+    return select_pathways(pathways, lambda path: path[0] == source)
 
 
 def find_paths_with_sink(pathways, sink):
     '''returns a subset of pathways that contain a given facility as the sink
     '''
-    if len(pathways) == 0:
-        return set()
-    
-    subset_pathways = set([ path for path in pathways if path[-1] == sink])
-    return subset_pathways
+    if is_pathway_set(pathways):
+        return pathways.with_sink(sink)
+    return select_pathways(pathways, lambda path: path[-1] == sink)
 
 
 def find_paths_containing_all(pathways, facilities):
     '''returns a subset of pathways that contain all facilities in input list
     '''
-    if len(pathways) == 0:
-        return set()
-
     # convert to list if user passed a string or int
     if type(facilities) == int or type(facilities) == str:
         facilities = [facilities]
-    
+
     # if user passed an empty list, return no pathways
     if not facilities:
-        return set()
-
-    p = set([path for path in pathways if set(facilities).issubset(path)])
+        return no_pathways(pathways)
 
-    return p
+    if is_pathway_set(pathways):
+        return pathways.containing_all(facilities)
+    facilities = set(facilities)
+    return select_pathways(pathways, lambda path: facilities.issubset(path))
 
 
 def find_paths_containing_one_of(pathways, facilities):
@@ -244,39 +759,85 @@ def find_paths_containing_one_of(pathways, facilities):
         facilities = [facilities]
 
     # if user passed an empty list, return no pathways
-    if len(pathways) == 0 or len(facilities) == 0:
-        return set()
+    if len(facilities) == 0:
+        return no_pathways(pathways)
 
+    if is_pathway_set(pathways):
+        return pathways.containing_one_of(facilities)
     facilities = set(facilities)
-    p = set([path for path in pathways if set(path).intersection(facilities)])
+    return select_pathways(pathways,
+                           lambda path: not facilities.isdisjoint(path))
+
+
+def summarize_pathways(pathways):
+    '''Counts the pathways and finds the shortest and longest ones in a
+    single pass, so it also works on a stream of pathways. Only the
+    pathways of the current shortest and longest length are kept.
+    outputs:
+        - num_paths: the number of pathways
+        - shortest: a set of the pathways of the shortest length
+        - longest: a set of the pathways of the longest length
+    '''
+    if is_pathway_set(pathways):
+        return len(pathways), pathways.shortest(), pathways.longest()
+
+    num_paths = 0
+    short_len = long_len = None
+    shortest = set()
+    longest = set()
+    for path in pathways:
+        num_paths += 1
+        length = len(path)
+
+        if short_len is None or length < short_len:
+            short_len = length
+            shortest = {path}
+        elif length == short_len:
+            shortest.add(path)
+
+        if long_len is None or length > long_len:
+            long_len = length
+            longest = {path}
+        elif length == long_len:
+            longest.add(path)
 
-    return p
+    return num_paths, shortest, longest
 
 
 def get_shortest_path(pathways):
     '''Finds the set of pathways with the shortest number of steps from source to
     target. Returns a tuple with path and length.
     '''
-    if len(pathways) != 0:
-        short_len = min([len(path) for path in pathways])
-        shortest = set([path for path in pathways if len(path) == short_len])
-    else:
-        shortest = set()
-
-    return shortest
+    if is_pathway_set(pathways):
+        return pathways.shortest()
+    return find_paths_of_extreme_length(pathways, lambda a, b: a < b)
 
 
 def get_longest_path(pathways):
     '''Finds the pathway with the longest number of steps from source to
     target. Returns a tuple with path and length.
     '''
-    if len(pathways) != 0:
-        long_len = max([len(path) for path in pathways])
-        longest = set([path for path in pathways if len(path) == long_len])
-    else:
-        longest = set()
+    if is_pathway_set(pathways):
+        return pathways.longest()
+    return find_paths_of_extreme_length(pathways, lambda a, b: a > b)
 
-    return longest
+
+def find_paths_of_extreme_length(pathways, is_better):
+    '''Returns the set of pathways whose length no other pathway beats,
+    where is_better(a, b) says whether length a beats length b. Makes a
+    single pass over the pathways.
+    '''
+    best_len = None
+    best = set()
+    for path in pathways:
+        length = len(path)
+        if best_len is None or is_better(length, best_len):
+            best_len = length
+            best = {path}
+        elif length == best_len:
+            best.add(path)
+
+    return best
 
 
 def get_sources(G):
@@ -291,3 +852,154 @@ def get_sinks(G):
     '''
     sinks = list(node for node, out_deg in G.out_degree() if out_deg == 0)
     return sinks
+
+
+def can_reach(G, a, b, index=None):
+    '''Returns whether any pathway leads from facility a to facility b.
+    Build index = ap.ReachabilityIndex(G) once to answer many queries on
+    the same graph in O(1) each; without it every query costs O(V + E).
+    '''
+    if index is None:
+        index = ap.ReachabilityIndex(G, [b])
+
+    return index.can_reach(a, b)
+
+
+def find_chokepoints(G, sources=None, sinks=None):
+    '''Finds the facilities and commodity edges that every pathway from a
+    source to a sink must pass through, without enumerating pathways. A
+    node that every path from s to t passes through dominates t, so one
+    dominator tree per source (see build_dominator_graph) answers all of
+    its sinks in near-linear time.
+    inputs:
+        - G: a graph from acquisition_paths.build_graph or
+        build_bipartite_graph
+        - sources, sinks: a facility or a list of facilities. Default to
+        the facilities without incoming and outgoing edges
+    outputs:
+        - chokepoints: a dictionary with format
+        {(source, sink) : (facilities, edges)}. facilities lists the
+        facilities on every pathway in pathway order, source and sink
+        included, i.e. the intersection of all the pathways. edges lists
+        the (sender, receiver, commodity) edges on every pathway; a step
+        that several commodities can make is not listed. Both are empty if
+        there is no pathway.
+    '''
+    (H, edge_nodes, sources, sinks) = build_dominator_graph(G, sources,
+                                                            sinks)
+    chokepoints = {}
+    for source in sources:
+        idom = nx.immediate_dominators(H, source)
+        for sink in sinks:
+            chokepoints[(source, sink)] = get_dominators(idom, source, sink,
+                                                         edge_nodes)
+
+    return chokepoints
+
+
+def find_source_chokepoints(G, sources=None, sinks=None):
+    '''Finds the facilities and commodity edges that every pathway from
+    each source to any of the sinks must pass through. The sinks feed a
+    virtual super-sink, whose dominators are these chokepoints. See
+    find_chokepoints.
+    outputs:
+        - chokepoints: a dictionary with format
+        {source : (facilities, edges)}, the facilities starting at the
+        source. Both are empty if the source reaches no sink.
+    '''
+    (H, edge_nodes, sources, sinks) = build_dominator_graph(G, sources,
+                                                            sinks)
+    super_sink = object()
+    H.add_edges_from((sink, super_sink) for sink in sinks)
+
+    chokepoints = {}
+    for source in sources:
+        idom = nx.immediate_dominators(H, source)
+        (facilities, edges) = get_dominators(idom, source, super_sink,
+                                             edge_nodes)
+        chokepoints[source] = (facilities[:-1], edges)
+
+    return chokepoints
+
+
+def find_global_chokepoints(G, sources=None, sinks=None):
+    '''Finds the facilities and commodity edges that every pathway from any
+    source to any sink must pass through, with a virtual super-source
+    feeding the sources and a virtual super-sink fed by the sinks. See
+    find_chokepoints.
+    outputs:
+        - facilities: the mandatory facilities in pathway order. A source
+        or sink is only mandatory if it is the only one pathways can use
+        - edges: the mandatory (sender, receiver, commodity) edges
+    '''
+    (H, edge_nodes, sources, sinks) = build_dominator_graph(G, sources,
+                                                            sinks)
+    (super_source, super_sink) = (object(), object())
+    H.add_edges_from((super_source, source) for source in sources)
+    H.add_edges_from((sink, super_sink) for sink in sinks)
+
+    idom = nx.immediate_dominators(H, super_source)
+    (facilities, edges) = get_dominators(idom, super_source, super_sink,
+                                         edge_nodes)
+
+    return facilities[1:-1], edges
+
+
+def build_dominator_graph(G, sources=None, sinks=None):
+    '''Subdivides every commodity edge of G with a node of its own, so that
+    edges can be dominators as well as facilities. Self-loops are dropped
+    since no pathway uses them.
+    outputs:
+        - H: a DiGraph
+        - edge_nodes: a dictionary with format
+        {node : (sender, receiver, commodity)} of the subdividing nodes
+        - sources, sinks: lists of facilities
+    '''
+    F = ap.project_facility_graph(G)
+    if sources is None:
+        sources = get_sources(F)
+    if sinks is None:
+        sinks = get_sinks(F)
+    if type(sources) == int or type(sources) == str:
+        sources = [sources]
+    if type(sinks) == int or type(sinks) == str:
+        sinks = [sinks]
+    for node in [*sources, *sinks]:
+        if node not in F:
+            raise nx.NodeNotFound('source or target %s not in G' % (node,))
+
+    H = nx.DiGraph()
+    H.add_nodes_from(F)
+    edge_nodes = {}
+    for (u, v, commod) in F.edges(data='commodity'):
+        if u == v:
+            continue
+        node = ('edge', u, v, commod)
+        edge_nodes[node] = (u, v, commod)
+        H.add_edge(u, node)
+        H.add_edge(node, v)
+
+    return H, edge_nodes, list(dict.fromkeys(sources)), list(
+        dict.fromkeys(sinks))
+
+
+def get_dominators(idom, root, node, edge_nodes):
+    '''Walks up the dominator tree idom of nx.immediate_dominators(H, root)
+    from node to root.
+    outputs:
+        - facilities: the dominating facilities from root to node
+        - edges: the dominating commodity edges in the same order
+    '''
+    # some networkx versions leave the root out of idom
+    if node != root and node not in idom:
+        return [], []
+
+    chain = [node]
+    while chain[-1] != root:
+        chain.append(idom[chain[-1]])
+    chain.reverse()
+
+    facilities = [n for n in chain if n not in edge_nodes]
+    edges = [edge_nodes[n] for n in chain if n in edge_nodes]
+
+    return facilities, edges
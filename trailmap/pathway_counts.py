@@ -0,0 +1,288 @@
+import networkx as nx
+from collections import Counter
+from more_itertools import pairwise
+import trailmap.acquisition_paths as ap
+
+
+# default maximum number of simple paths enumerated inside the strongly
+# connected components of a graph while counting pathways
+SCC_PATH_LIMIT = 1000000
+
+
+def count_pathways(G, sources=None, sinks=None, scc_path_limit=SCC_PATH_LIMIT):
+    '''Counts the simple pathways from each source to each sink without
+    enumerating them. Counts are exact Python integers and match
+    len(find_simple_paths(G, source, sink)).
+
+    The graph is condensed into its strongly connected components (SCCs).
+    Pathways are counted by dynamic programming over the acyclic
+    condensation in O(V + E) per sink. Inside an SCC with more than one
+    facility a pathway may take many routes, so the simple paths between
+    the facilities of each SCC are enumerated once, up to scc_path_limit
+    paths in total. On an acyclic graph nothing is enumerated.
+    inputs:
+        - G: a graph from acquisition_paths.build_graph or
+        build_bipartite_graph
+        - sources, sinks: a facility or a list of facilities. Default to
+        the facilities without incoming and outgoing edges
+        - scc_path_limit: raises ValueError if counting would need to
+        enumerate more paths than this inside the SCCs
+    outputs:
+        - counts: a dictionary with format {(source, sink) : count}
+    '''
+    (D, sources, sinks) = get_counting_graph(G, sources, sinks)
+    condensation = CondensedGraph(D, sources, scc_path_limit)
+
+    counts = {}
+    for sink in sinks:
+        paths_to_sink = condensation.count_paths_to(sink)
+        for source in sources:
+            counts[(source, sink)] = paths_to_sink.get(source, 0)
+
+    return counts
+
+
+def count_all_pathways(G, sources=None, sinks=None,
+                       scc_path_limit=SCC_PATH_LIMIT):
+    '''Counts the simple pathways from any source to any sink, i.e.
+    len(find_simple_paths(G, sources, sinks)), without enumerating them.
+    See count_pathways.
+    '''
+    return sum(count_pathways(G, sources, sinks, scc_path_limit).values())
+
+
+def count_pathway_traversals(G, sources=None, sinks=None, fallback=True,
+                             max_paths=None):
+    '''Counts how many pathways from the sources to the sinks pass through
+    each facility and each commodity edge, e.g. to rank them for
+    safeguards.
+
+    On an acyclic graph, a pathway through facility v is a path from a
+    source to v followed by a path from v to a sink. The number of pathways
+    through v is therefore paths_to(v) * paths_from(v), and through an
+    edge (u, v) it is paths_to(u) * paths_from(v). Both counts are
+    propagated over the graph in O(V + E), without enumeration.
+
+    A cycle breaks this product, since the two halves could share a
+    facility. If the graph has a cycle and fallback is True, the pathways
+    are enumerated with iter_simple_paths and tallied instead. If fallback
+    is False, or if there are more than max_paths pathways, ValueError is
+    raised.
+    inputs:
+        - G: a graph from acquisition_paths.build_graph or
+        build_bipartite_graph
+        - sources, sinks: a facility or a list of facilities. Default to
+        the facilities without incoming and outgoing edges
+    outputs:
+        - node_counts: a dictionary with format {facility : count}
+        - edge_counts: a dictionary with format
+        {(sender, receiver, commodity) : count}. Every commodity traded
+        between two facilities gets the count of pathways stepping from
+        one to the other.
+    '''
+    (D, sources, sinks) = get_counting_graph(G, sources, sinks)
+
+    if nx.is_directed_acyclic_graph(D):
+        step_counts = propagate_traversal_counts(D, sources, sinks)
+    elif fallback:
+        step_counts = tally_traversal_counts(G, sources, sinks, max_paths)
+    else:
+        raise ValueError('G has cycles; pathway traversals can only be '
+                         'counted by enumeration, use fallback=True')
+
+    (node_counts, pair_counts) = step_counts
+    edge_counts = {}
+    for (u, v, commod) in ap.project_facility_graph(G).edges(
+            data='commodity'):
+        edge_counts[(u, v, commod)] = pair_counts.get((u, v), 0)
+
+    return node_counts, edge_counts
+
+
+def propagate_traversal_counts(D, sources, sinks):
+    '''Counts the pathways through each facility and facility pair of an
+    acyclic facility DiGraph by forward and backward path counting.
+    outputs:
+        - node_counts: a dictionary with format {facility : count}
+        - pair_counts: a dictionary with format {(sender, receiver) : count}
+    '''
+    order = list(nx.topological_sort(D))
+    sources = set(sources)
+    sinks = set(sinks)
+
+    # paths_to[v]: paths from any source that end at v
+    paths_to = {}
+    for v in order:
+        paths_to[v] = (1 if v in sources else 0) + sum(
+            paths_to[u] for u in D.predecessors(v))
+
+    # paths_from[v]: paths from v that end at any sink
+    paths_from = {}
+    for v in reversed(order):
+        paths_from[v] = (1 if v in sinks else 0) + sum(
+            paths_from[w] for w in D.successors(v))
+
+    node_counts = {v: paths_to[v] * paths_from[v] for v in order}
+    pair_counts = {(u, v): paths_to[u] * paths_from[v]
+                   for (u, v) in D.edges()}
+
+    return node_counts, pair_counts
+
+
+def tally_traversal_counts(G, sources, sinks, max_paths=None):
+    '''Counts the pathways through each facility and facility pair by
+    enumerating the pathways.
+    outputs:
+        - node_counts: a dictionary with format {facility : count}
+        - pair_counts: a dictionary with format {(sender, receiver) : count}
+    '''
+    node_counts = Counter({node: 0 for node in ap.get_facility_nodes(G)})
+    pair_counts = Counter()
+    stats = {}
+    for path in ap.iter_simple_paths(G, sources, sinks, max_paths=max_paths,
+                                     stats=stats):
+        node_counts.update(path)
+        pair_counts.update(pairwise(path))
+
+    if stats['truncated']:
+        raise ValueError('G has more than ' + str(max_paths) + ' pathways '
+                         'to enumerate')
+
+    return dict(node_counts), dict(pair_counts)
+
+
+def get_counting_graph(G, sources=None, sinks=None):
+    '''Collapses G into a DiGraph of facilities, with an edge wherever a
+    facility sends a commodity to another, and resolves the default
+    sources and sinks. Self-loops are dropped since no simple pathway uses
+    them.
+    outputs:
+        - D: a DiGraph
+        - sources: a list of facilities
+        - sinks: a list of facilities
+    '''
+    facilities = ap.get_facility_nodes(G)
+    successors = ap.get_successor_function(G)
+
+    D = nx.DiGraph()
+    D.add_nodes_from(facilities)
+    D.add_edges_from((u, v) for u in facilities for v in successors(u)
+                     if u != v)
+
+    if sources is None:
+        sources = [node for node in facilities
+                   if G.in_degree(node) == 0]
+    if sinks is None:
+        sinks = [node for node in facilities
+                 if G.out_degree(node) == 0]
+
+    # turn sources/sinks into list if a single string/int was submitted
+    if type(sources) == int or type(sources) == str:
+        sources = [sources]
+    if type(sinks) == int or type(sinks) == str:
+        sinks = [sinks]
+
+    for node in [*sources, *sinks]:
+        if node not in D:
+            raise nx.NodeNotFound('source or target %s not in G' % (node,))
+
+    return D, list(dict.fromkeys(sources)), list(dict.fromkeys(sinks))
+
+
+class CondensedGraph:
+    '''Strongly connected component condensation of a facility DiGraph, with
+    the simple path counts between the facilities inside each component.
+
+    A pathway can only start inside a component at one of the given
+    sources or enter it at a facility with a predecessor in another
+    component. Counts are kept for these entries, and the paths inside a
+    component are only enumerated from them.
+    '''
+    def __init__(self, D, sources=(), scc_path_limit=SCC_PATH_LIMIT):
+        self.D = D
+        self.C = nx.condensation(D)
+        self.component = self.C.graph['mapping']
+        # components in reverse topological order, i.e. sinks first
+        self.order = list(reversed(list(nx.topological_sort(self.C))))
+        self.entries = set(sources)
+        for (u, v) in D.edges():
+            if self.component[u] != self.component[v]:
+                self.entries.add(v)
+        self.scc_path_limit = scc_path_limit
+        self.scc_paths_enumerated = 0
+        self._internal_paths = {}
+
+    def members(self, c):
+        '''Returns the facilities of component c'''
+        return self.C.nodes[c]['members']
+
+    def internal_paths(self, node):
+        '''Counts the simple paths from node to every facility of its
+        component that stay inside the component. The empty path from node
+        to itself is included.
+        outputs:
+            - paths: a dictionary with format {facility : count}
+        '''
+        if node in self._internal_paths:
+            return self._internal_paths[node]
+
+        c = self.component[node]
+        members = self.members(c)
+        paths = {node: 1}
+        if len(members) > 1:
+            for path in ap.iter_facility_paths(self.D.subgraph(members), node,
+                                               members):
+                if len(path) == 1:
+                    continue
+                self.scc_paths_enumerated += 1
+                if self.scc_paths_enumerated > self.scc_path_limit:
+                    raise ValueError('Counting pathways needs more than '
+                                     + str(self.scc_path_limit)
+                                     + ' paths to be enumerated inside the '
+                                     'strongly connected components of G')
+                paths[path[-1]] = paths.get(path[-1], 0) + 1
+
+        self._internal_paths[node] = paths
+        return paths
+
+    def count_paths_from_exits(self, c, counts, is_target):
+        '''For each facility w of component c, counts the simple paths that
+        end at w or leave the component from w and end at a target. counts
+        must hold the counts of every facility entered from c.
+        '''
+        exits = {}
+        for w in self.members(c):
+            n = 1 if is_target(w) else 0
+            for x in self.D.successors(w):
+                if self.component[x] != c:
+                    n += counts[x]
+            exits[w] = n
+
+        return exits
+
+    def count_paths_to(self, sink):
+        '''Counts the simple paths from every entry facility to sink.
+        outputs:
+            - counts: a dictionary with format {facility : count}
+        '''
+        return self.count_paths(lambda node: node == sink)
+
+    def count_paths(self, is_target):
+        '''Counts the simple paths from every entry facility to any facility
+        for which is_target is True. A path may pass through targets before
+        it ends at one. Facilities in a component of one are always entries.
+        outputs:
+            - counts: a dictionary with format {facility : count}
+        '''
+        counts = {}
+        for c in self.order:
+            exits = self.count_paths_from_exits(c, counts, is_target)
+            members = self.members(c)
+            if len(members) == 1:
+                counts.update(exits)
+                continue
+            for v in self.entries.intersection(members):
+                counts[v] = sum(n * exits[w] for w, n in
+                                self.internal_paths(v).items())
+
+        return counts
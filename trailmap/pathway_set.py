@@ -0,0 +1,420 @@
+from array import array
+from collections.abc import Set
+import numpy as np
+
+
+def build_pathway_set(pathways, names=None):
+    '''Packs pathways into a PathwaySet in a single pass, so a stream of
+    pathways is never held as tuples. Unless pathways is a set, repeated
+    pathways are then dropped over the packed columns (see
+    find_duplicate_rows), so the result is a set even if the input is not.
+    inputs:
+        - pathways: an iterable of pathways. If names is None the pathways
+        hold facility names, otherwise they hold ids into names, e.g. from
+        graph_core.CompactGraph.get_id_path
+        - names: a list of facility names indexed by id
+    outputs:
+        - pathways: a PathwaySet
+    '''
+    nodes = array('q')
+    offsets = array('q', [0])
+    if names is None:
+        names = []
+        ids = {}
+        for path in pathways:
+            for node in path:
+                if node not in ids:
+                    ids[node] = len(names)
+                    names.append(node)
+                nodes.append(ids[node])
+            offsets.append(len(nodes))
+    else:
+        for path in pathways:
+            nodes.extend(path)
+            offsets.append(len(nodes))
+
+    nodes = np.array(nodes, dtype=np.int32)
+    offsets = np.array(offsets, dtype=np.int64)
+    if not isinstance(pathways, Set):
+        duplicates = find_duplicate_rows(nodes, offsets)
+        if duplicates.any():
+            lengths = np.diff(offsets)[~duplicates]
+            nodes = nodes[np.repeat(~duplicates, np.diff(offsets))]
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    return PathwaySet(list(names), nodes, offsets)
+
+
+def find_duplicate_rows(nodes, offsets):
+    '''Finds the pathways of packed columns that repeat an earlier one.
+    Each pathway is hashed with numpy and the pathways are sorted by
+    length, source and hash, so only neighbours in that order can be equal.
+    Those few candidates are compared node by node.
+    outputs:
+        - duplicates: a boolean array, True for every pathway that equals
+        a pathway of a lower index
+    '''
+    n = len(offsets) - 1
+    lengths = np.diff(offsets)
+    duplicates = np.zeros(n, dtype=bool)
+    if n < 2:
+        return duplicates
+
+    # sum the node ids of each pathway mixed with their positions, one
+    # position at a time so that no temporary spans the node column.
+    # uint64 arithmetic wraps around
+    starts = offsets[:-1]
+    hashes = np.zeros(n, dtype=np.uint64)
+    rows = np.flatnonzero(lengths > 0)
+    for position in range(int(lengths.max())):
+        rows = rows[lengths[rows] > position]
+        values = nodes[starts[rows] + position].astype(np.uint64)
+        hashes[rows] += mix_bits((values << np.uint64(32))
+                                 | np.uint64(position))
+    sources = np.full(n, -1, dtype=np.int64)
+    sources[lengths > 0] = nodes[starts[lengths > 0]]
+
+    # lexsort is stable, so equal pathways stay in input order
+    order = np.lexsort((hashes, sources, lengths))
+    same = ((lengths[order[1:]] == lengths[order[:-1]])
+            & (sources[order[1:]] == sources[order[:-1]])
+            & (hashes[order[1:]] == hashes[order[:-1]]))
+    group_start = 0
+    for k in np.flatnonzero(same).tolist():
+        # order[k + 1] is a candidate; compare it with the earlier pathways
+        # of its run of equal keys that were kept
+        if k == 0 or not same[k - 1]:
+            group_start = k
+        row = order[k + 1]
+        path = nodes[offsets[row]:offsets[row + 1]]
+        for other in order[group_start:k + 1].tolist():
+            if (not duplicates[other]
+                    and np.array_equal(nodes[offsets[other]:
+                                             offsets[other + 1]], path)):
+                duplicates[row] = True
+                break
+
+    return duplicates
+
+
+def mix_bits(values):
+    '''Scrambles an array of uint64 values with the splitmix64 finalizer'''
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+class PathwaySet(Set):
+    '''Read-only set of pathways stored as columns. The facilities of
+    pathway i are names[nodes[offsets[i]:offsets[i + 1]]], and the length,
+    source and sink of every pathway are precomputed arrays.
+
+    Length queries are vectorized over these arrays. Source, sink and
+    membership filters are answered from a PathwayIndex shared by every
+    view, whose parts are built on the first query that needs them. Both
+    return a new PathwaySet that shares the columns and only holds the
+    indices of the selected pathways.
+    Iterating yields pathways as tuples of names, so a PathwaySet compares
+    equal to the set of the same pathways and can be passed to the
+    functions of pathway_analysis, which return PathwaySets for it.
+    '''
+    def __init__(self, names, nodes, offsets, rows=None):
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.nodes = nodes
+        self.offsets = offsets
+        self.lengths = np.diff(offsets)
+        starts = offsets[:-1]
+        self.sources = nodes[starts]
+        self.sinks = nodes[starts + self.lengths - 1]
+        if rows is None:
+            rows = np.arange(len(starts))
+        self.rows = rows
+        # state shared by every view of the same columns
+        self._shared = {}
+
+    def view(self, rows):
+        '''Returns the PathwaySet of the given pathway indices, sharing the
+        columns of self.
+        '''
+        view = object.__new__(PathwaySet)
+        view.__dict__.update(self.__dict__)
+        view.rows = rows
+        return view
+
+    @property
+    def index(self):
+        '''The PathwayIndex of the columns, created on first use and shared
+        with every view
+        '''
+        if 'index' not in self._shared:
+            self._shared['index'] = PathwayIndex(self.nodes, self.offsets,
+                                                 len(self.names))
+        return self._shared['index']
+
+    def select_rows(self, rows):
+        '''Returns the view of the pathways in both this view and the sorted
+        array of pathway indices rows
+        '''
+        if len(self.rows) == len(self.lengths):
+            return self.view(rows)
+        return self.view(np.intersect1d(self.rows, rows, assume_unique=True))
+
+    @classmethod
+    def _from_iterable(cls, pathways):
+        # results of set operations such as & and | are plain sets
+        return set(pathways)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        names = self.names
+        offsets = self.offsets
+        for i in self.rows.tolist():
+            ids = self.nodes[offsets[i]:offsets[i + 1]].tolist()
+            yield tuple(names[j] for j in ids)
+
+    def __contains__(self, path):
+        try:
+            ids = [self.ids[node] for node in path]
+        except (KeyError, TypeError):
+            return False
+        if not ids:
+            return False
+
+        rows = self.rows[(self.lengths[self.rows] == len(ids))
+                         & (self.sources[self.rows] == ids[0])]
+        for i in rows.tolist():
+            if self.nodes[self.offsets[i]:self.offsets[i + 1]].tolist() == ids:
+                return True
+        return False
+
+    def __repr__(self):
+        return 'PathwaySet(' + repr(set(self)) + ')'
+
+    def get_id(self, facility):
+        '''Returns the id of a facility, or -1 if no pathway holds it'''
+        return self.ids.get(facility, -1)
+
+    def select(self, mask):
+        '''Returns the view of the pathways for which the boolean mask over
+        self.rows is True.
+        '''
+        return self.view(self.rows[mask])
+
+    def select_where(self, keep):
+        '''Returns the view of the pathways for which keep(path) is True.
+        keep is called on every pathway, so prefer the vectorized filters.
+        '''
+        return self.select(np.fromiter((bool(keep(path)) for path in self),
+                                       dtype=bool, count=len(self)))
+
+    def empty(self):
+        '''Returns an empty view'''
+        return self.view(self.rows[:0])
+
+    def with_source(self, source):
+        '''Returns the view of the pathways starting at source'''
+        return self.select_rows(self.index.get_source_rows(
+            self.get_id(source)))
+
+    def with_sink(self, sink):
+        '''Returns the view of the pathways ending at sink'''
+        return self.select_rows(self.index.get_sink_rows(self.get_id(sink)))
+
+    def containing_all(self, facilities):
+        '''Returns the view of the pathways that hold every facility'''
+        return self.select_rows(self.index.get_all_rows(
+            [self.get_id(facility) for facility in facilities]))
+
+    def containing_one_of(self, facilities):
+        '''Returns the view of the pathways that hold any of the facilities
+        '''
+        return self.select_rows(self.index.get_one_of_rows(
+            [self.get_id(facility) for facility in facilities]))
+
+    def min_length(self):
+        '''Returns the number of facilities of the shortest pathway'''
+        return int(self.lengths[self.rows].min()) if len(self) else None
+
+    def max_length(self):
+        '''Returns the number of facilities of the longest pathway'''
+        return int(self.lengths[self.rows].max()) if len(self) else None
+
+    def shortest(self):
+        '''Returns the view of the pathways of the shortest length'''
+        if not len(self):
+            return self.empty()
+        return self.select(self.lengths[self.rows] == self.min_length())
+
+    def longest(self):
+        '''Returns the view of the pathways of the longest length'''
+        if not len(self):
+            return self.empty()
+        return self.select(self.lengths[self.rows] == self.max_length())
+
+    def length_histogram(self):
+        '''Returns a dictionary with format {length : number of pathways}'''
+        counts = np.bincount(self.lengths[self.rows])
+        return {length: int(counts[length])
+                for length in np.flatnonzero(counts).tolist()}
+
+
+def group_rows(keys, n_keys):
+    '''Groups the pathways by key in CSR form: the pathways with key f are
+    order[ptr[f]:ptr[f + 1]], in increasing order.
+    outputs:
+        - order: the pathway indices sorted by key
+        - ptr: an array of n_keys + 1 offsets into order
+    '''
+    order = np.argsort(keys, kind='stable')
+    ptr = np.searchsorted(keys[order], np.arange(n_keys + 1))
+    return order, ptr
+
+
+def is_bitmap(container):
+    '''Tells a packed bitmap container of a PathwayIndex from a sorted
+    array of pathway indices
+    '''
+    return container.dtype == np.uint8
+
+
+def bitmap_to_mask(bitmap, n):
+    '''Unpacks a bitmap container into a boolean mask over n pathways'''
+    return np.unpackbits(bitmap, count=n, bitorder='little').view(bool)
+
+
+def bitmap_holds(bitmap, rows):
+    '''Returns a boolean array telling whether each row is in a bitmap
+    container
+    '''
+    return ((bitmap[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1) == 1
+
+
+class PathwayIndex:
+    '''Inverted index of pathway columns, from each facility id to the
+    pathways that start at it, end at it and hold it. Each part is built on
+    the first query that needs it, so a source filter never pays for the
+    membership containers.
+
+    Each pathway has one source and one sink, so those are grouped into
+    CSR arrays of pathway indices, O(P + F) in size for P pathways and F
+    facilities. Membership is a compressed bitmap per facility, kept in
+    the smaller of two forms: the sorted array of the pathways holding it,
+    or a packed bitmap of P bits once it is held by more than one pathway
+    in 32. The containers take no more memory than the node column, and
+    "all" and "one of" queries intersect and merge them.
+    '''
+    def __init__(self, nodes, offsets, n_facilities):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.n = len(offsets) - 1
+        self.n_facilities = n_facilities
+        self._sources = None
+        self._sinks = None
+        self._holding = None
+
+    @property
+    def sources(self):
+        '''The (order, ptr) grouping of the pathways by source'''
+        if self._sources is None:
+            self._sources = group_rows(self.nodes[self.offsets[:-1]],
+                                       self.n_facilities)
+        return self._sources
+
+    @property
+    def sinks(self):
+        '''The (order, ptr) grouping of the pathways by sink'''
+        if self._sinks is None:
+            self._sinks = group_rows(self.nodes[self.offsets[1:] - 1],
+                                     self.n_facilities)
+        return self._sinks
+
+    @property
+    def holding(self):
+        '''A dictionary with format {facility id : container} of the
+        pathways holding each facility
+        '''
+        if self._holding is None:
+            self._holding = self.build_holding()
+        return self._holding
+
+    def build_holding(self):
+        '''Builds the membership containers in one sort of the node column
+        '''
+        # pathway indices fit the 4 bytes of a node id up to 2**31 pathways
+        dtype = np.int32 if self.n < 2 ** 31 else np.int64
+        owners = np.repeat(np.arange(self.n, dtype=dtype),
+                           np.diff(self.offsets))
+        order = np.argsort(self.nodes, kind='stable')
+        (keys, owners) = (self.nodes[order], owners[order])
+        # a pathway counts once for a facility it holds more than once
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (owners[1:] != owners[:-1])
+        (keys, owners) = (keys[keep], owners[keep])
+
+        (unique, starts) = np.unique(keys, return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        holding = {}
+        for key, start, end in zip(unique.tolist(), starts, ends):
+            rows = owners[start:end]
+            if 8 * rows.itemsize * len(rows) > self.n:
+                mask = np.zeros(self.n, dtype=bool)
+                mask[rows] = True
+                holding[key] = np.packbits(mask, bitorder='little')
+            else:
+                holding[key] = rows.copy()
+        return holding
+
+    def get_source_rows(self, facility):
+        '''Returns the indices of the pathways starting at a facility id'''
+        return self.get_group(self.sources, facility)
+
+    def get_sink_rows(self, facility):
+        '''Returns the indices of the pathways ending at a facility id'''
+        return self.get_group(self.sinks, facility)
+
+    def get_group(self, grouping, facility):
+        '''Returns the pathway indices of a facility id in a grouping'''
+        (order, ptr) = grouping
+        if not 0 <= facility < self.n_facilities:
+            return order[:0]
+        return order[ptr[facility]:ptr[facility + 1]]
+
+    def get_all_rows(self, facilities):
+        '''Returns the indices of the pathways holding every facility id'''
+        if not facilities:
+            return np.arange(self.n)
+        containers = [self.holding.get(facility) for facility in facilities]
+        if any(container is None for container in containers):
+            return np.arange(0)
+        bitmaps = [c for c in containers if is_bitmap(c)]
+        arrays = sorted((c for c in containers if not is_bitmap(c)), key=len)
+        if not arrays:
+            return np.flatnonzero(bitmap_to_mask(
+                np.bitwise_and.reduce(bitmaps), self.n))
+
+        # the shortest array bounds the result, so test it against the rest
+        rows = arrays[0]
+        for container in arrays[1:]:
+            rows = np.intersect1d(rows, container, assume_unique=True)
+        for bitmap in bitmaps:
+            rows = rows[bitmap_holds(bitmap, rows)]
+        return rows
+
+    def get_one_of_rows(self, facilities):
+        '''Returns the indices of the pathways holding any facility id'''
+        containers = [self.holding[facility] for facility in facilities
+                      if facility in self.holding]
+        bitmaps = [c for c in containers if is_bitmap(c)]
+        arrays = [c for c in containers if not is_bitmap(c)]
+        if not bitmaps:
+            return np.unique(np.concatenate(arrays or [np.arange(0)]))
+
+        mask = bitmap_to_mask(np.bitwise_or.reduce(bitmaps), self.n)
+        for rows in arrays:
+            mask[rows] = True
+        return np.flatnonzero(mask)